@@ -0,0 +1,275 @@
+import asyncio
+import http.client
+import io
+from urllib.parse import urlencode, urljoin, urlsplit
+from auth import PortalProtocol, AuthResult
+from logger import logger
+from retry import RetryPolicy, CircuitBreaker, classify_exception
+from transport import Response, TransportError, REDIRECT_CODES, MAX_REDIRECTS
+
+
+class AsyncHttpTransport:
+    """基于 asyncio 流的轻量HTTP/1.1客户端
+
+    每个会话只保持一个到门户的长连接；请求被取消或超时时丢弃该连接，
+    避免下一个请求读到上一个请求的响应。
+    """
+
+    __slots__ = ('headers', 'cookies', '_key', '_reader', '_writer', '_lock')
+
+    def __init__(self, headers=None):
+        self.headers = dict(headers or {})
+        self.headers['Connection'] = 'keep-alive'
+        self.cookies = {}
+        self._key = None
+        self._reader = None
+        self._writer = None
+        # 在首次请求时创建，保证属于正在运行的事件循环
+        self._lock = None
+
+    async def request(self, method, url, params=None, data=None, allow_redirects=True,
+                      max_bytes=None):
+        """发送请求；max_bytes 不为空时不跟随跳转，只读取响应体开头"""
+        if params:
+            url += ('&' if '?' in url else '?') + urlencode(params)
+        body = urlencode(data).encode() if data is not None else None
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            for _ in range(MAX_REDIRECTS + 1):
+                response = await self._send(method, url, body, max_bytes)
+                location = response.headers.get('Location')
+                if (max_bytes is not None or not allow_redirects
+                        or response.status_code not in REDIRECT_CODES or not location):
+                    return response
+                url = urljoin(url, location)
+                if response.status_code in (301, 302, 303) and method == 'POST':
+                    method, body = 'GET', None
+        raise TransportError("重定向次数过多")
+
+    async def _send(self, method, url, body, max_bytes):
+        parts = urlsplit(url)
+        if parts.scheme != 'http':
+            raise TransportError(f"不支持的协议: {parts.scheme}")
+        key = (parts.hostname, parts.port or 80)
+        path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+
+        headers = dict(self.headers, Host=parts.netloc)
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f"{k}={v}" for k, v in self.cookies.items())
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        headers['Content-Length'] = str(len(body or b''))
+        head = f"{method} {path} HTTP/1.1\r\n" + ''.join(
+            f"{name}: {value}\r\n" for name, value in headers.items()) + "\r\n"
+        payload = head.encode('latin-1') + (body or b'')
+
+        reused = self._writer is not None and self._key == key
+        try:
+            if not reused:
+                await self._connect(key)
+            try:
+                status, response_headers = await self._exchange(payload)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                if not reused:
+                    raise
+                # 复用的连接已被门户关闭，重新连接后重试一次
+                await self._connect(key)
+                status, response_headers = await self._exchange(payload)
+            content, keep = await self._read_body(method, status, response_headers, max_bytes)
+        except BaseException:
+            # 包括取消和超时：连接状态未知，直接丢弃
+            self._drop()
+            raise
+        if not keep:
+            self._drop()
+        self._store_cookies(response_headers)
+        return Response(status, url, response_headers, content)
+
+    async def _connect(self, key):
+        self._drop()
+        self._reader, self._writer = await asyncio.open_connection(key[0], key[1])
+        self._key = key
+
+    async def _exchange(self, payload):
+        self._writer.write(payload)
+        await self._writer.drain()
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionResetError("连接已被关闭")
+        status = status_line.split(None, 2)[1]
+        lines = []
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            lines.append(line)
+        headers = http.client.parse_headers(io.BytesIO(b''.join(lines) + b'\r\n'))
+        return int(status), headers
+
+    async def _read_body(self, method, status, headers, max_bytes):
+        """读取响应体，返回 (内容, 连接能否复用)"""
+        keep = (headers.get('Connection') or '').lower() != 'close'
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            return b'', keep
+        if 'chunked' in (headers.get('Transfer-Encoding') or '').lower():
+            content = b''
+            while True:
+                size = int((await self._reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    # 跳过结尾的空行
+                    await self._reader.readline()
+                    return content, keep
+                content += await self._reader.readexactly(size)
+                await self._reader.readexactly(2)
+                if max_bytes is not None and len(content) >= max_bytes:
+                    return content[:max_bytes], False
+        length = headers.get('Content-Length')
+        if length is None:
+            # 没有长度的响应读到连接关闭为止
+            content = await self._reader.read(-1 if max_bytes is None else max_bytes)
+            return content, False
+        length = int(length)
+        if max_bytes is not None and length > max_bytes:
+            return await self._reader.readexactly(max_bytes), False
+        return await self._reader.readexactly(length), keep
+
+    def _store_cookies(self, headers):
+        for header in headers.get_all('Set-Cookie') or ():
+            name, _, value = header.split(';', 1)[0].partition('=')
+            if name.strip():
+                self.cookies[name.strip()] = value.strip()
+
+    def _drop(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = self._key = None
+
+    async def close(self):
+        writer = self._writer
+        self._drop()
+        if writer is not None:
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+
+class AsyncAuthenticator(PortalProtocol):
+    """Authenticator 的异步版本，与同步版共用 PortalProtocol 中的协议逻辑
+
+    一个事件循环可以同时驱动大量会话。各方法的 timeout 参数限制整个调用的耗时，
+    单个请求的超时为 request_timeout；任务被取消时 CancelledError 照常向上抛出。
+    """
+
+    __slots__ = ('base_url', 'login_url', 'request_timeout', 'query_params',
+                 'retry_policy', 'circuit_breaker', 'transport')
+
+    def __init__(self, base_url=None, request_timeout=3, query_params=None,
+                 retry_policy=None, circuit_breaker=None, transport=None):
+        self._use_portal(base_url or self.DEFAULT_BASE_URL)
+        self.request_timeout = request_timeout
+        self.query_params = dict(query_params or {})
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.transport = transport or AsyncHttpTransport(
+            headers={'User-Agent': 'Mozilla/5.0', 'Accept': '*/*'})
+
+    async def _request(self, method, url, **kwargs):
+        return await asyncio.wait_for(self.transport.request(method, url, **kwargs),
+                                      self.request_timeout)
+
+    async def close(self):
+        """关闭连接"""
+        await self.transport.close()
+
+    async def check_status(self, timeout=None):
+        """检查当前认证状态，timeout 秒内没有结果时返回False"""
+        return bool(await self.online_info(timeout))
+
+    async def online_info(self, timeout=None):
+        """查询在线信息 OnlineUserInfo，timeout 秒内没有结果或查询失败时返回None"""
+        try:
+            response = await asyncio.wait_for(
+                self._request('GET', f"{self.base_url}{self.STATUS_PATH}"), timeout)
+            return self._parse_status(response)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            return None
+
+    async def get_auth_params(self, timeout=None):
+        """访问认证页面，返回带认证参数的地址，获取失败时返回None"""
+        try:
+            return await asyncio.wait_for(self._run_steps(self._auth_page_steps()), timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"获取认证参数时出错: {str(e)}")
+            return None
+
+    async def _run_steps(self, steps):
+        """发送 _discovery_steps 等流程产出的请求，返回流程的结果"""
+        try:
+            step = next(steps)
+            while True:
+                kind, url, params = step
+                try:
+                    if kind == self.STEP_PROBE:
+                        response = await self._request('GET', url, max_bytes=self.PROBE_MAX_BYTES)
+                    else:
+                        response = await self._request('GET', url, params=params)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    step = steps.throw(e)
+                else:
+                    step = steps.send(response)
+        except StopIteration as stop:
+            return stop.value
+
+    async def _discover_query_string(self):
+        """先不跟随跳转快速获取queryString，失败时访问完整认证页面"""
+        return await self._run_steps(self._discovery_steps())
+
+    async def login(self, username, password, timeout=None):
+        """登录认证，返回 AuthResult；timeout 秒内未完成时返回 TIMEOUT"""
+        try:
+            return await asyncio.wait_for(self._login(username, password), timeout)
+        except asyncio.TimeoutError:
+            logger.error("登录超时")
+            return AuthResult(False, AuthResult.TIMEOUT)
+
+    async def _login(self, username, password):
+        attempt = 0
+        while True:
+            circuit_open = self._circuit_open()
+            if circuit_open:
+                return circuit_open
+
+            attempt += 1
+            result = await self._login_once(username, password)
+            if not self._should_retry(result, attempt):
+                return result
+            await self.retry_policy.wait_async(attempt)
+
+    async def _login_once(self, username, password):
+        try:
+            # 状态查询反映的是本机IP，为指定终端登录时不据此判断
+            if not self.query_params and await self.check_status():
+                logger.info("已经认证，无需重复登录")
+                return AuthResult(True, AuthResult.ALREADY_ONLINE)
+
+            query_string = await self._discover_query_string()
+            if not query_string:
+                return AuthResult(False, AuthResult.NO_PARAMS)
+
+            data = self._login_form(username, password, query_string)
+            response = await self._request('POST', self.login_url, data=data)
+            return self._parse_login_response(response)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"认证出错: {str(e)}")
+            return AuthResult(False, classify_exception(e))
@@ -0,0 +1,17 @@
+import os
+from pathlib import Path
+
+
+def write_atomic(path, data):
+    """把 data(bytes)写入 path：先写临时文件并刷到磁盘，再原子替换
+
+    写入中途进程被结束或断电时，原文件保持完整，不会留下只写了一半的文件。
+    写入失败时抛出 OSError。
+    """
+    path = Path(path)
+    tmp_file = path.with_name(path.name + '.tmp')
+    with open(tmp_file, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, path)
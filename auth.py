@@ -1,124 +1,792 @@
-import requests
 import re
-from urllib.parse import quote, parse_qs, urlparse
+from urllib.parse import quote, parse_qs, urlparse, urljoin
 import time
+import json
+import socket
+import threading
+from concurrent.futures import Future
+from pathlib import Path
 from logger import logger
+from atomic_file import write_atomic
+from transport import create_transport, REDIRECT_CODES
+from tracing import tracer, traced
+from portal_race import PortalSelector
+from online_info import OnlineUserInfo
+from retry import (RetryPolicy, CircuitBreaker, ServerError, classify_exception, ERROR_TIMEOUT,
+                   ERROR_CONNECTION, ERROR_SERVER, ERROR_BAD_CREDENTIALS, ERROR_PROTOCOL)
 
-class Authenticator:
-    def __init__(self):
-        self.base_url = "http://10.10.10.52"
-        self.login_url = f"{self.base_url}/eportal/InterFace.do?method=login"
-        self.session = requests.session()
+class AuthCancelled(Exception):
+    """登录被取消"""
+
+
+class AuthResult:
+    """登录结果，可以直接当作布尔值使用，reason 说明原因"""
+
+    __slots__ = ('success', 'reason')
+
+    SUCCESS = 'success'
+    ALREADY_ONLINE = 'online'
+    UNREACHABLE = 'unreachable'
+    NO_PARAMS = 'no_params'
+    FAILED = 'failed'
+    ERROR = 'error'
+    # 熔断期间不发送请求
+    CIRCUIT_OPEN = 'circuit_open'
+    # 以下与 retry 模块的失败类型一致
+    TIMEOUT = ERROR_TIMEOUT
+    CONNECTION = ERROR_CONNECTION
+    SERVER_ERROR = ERROR_SERVER
+    BAD_CREDENTIALS = ERROR_BAD_CREDENTIALS
+    PROTOCOL = ERROR_PROTOCOL
+
+    def __init__(self, success, reason):
+        self.success = success
+        self.reason = reason
+
+    def __bool__(self):
+        return self.success
+
+    def __repr__(self):
+        return f"AuthResult({self.success}, {self.reason!r})"
+
+
+class PortalProtocol:
+    """门户认证协议中与网络IO无关的部分：请求地址、参数、响应解析和重试判断
+
+    同步的 Authenticator 与异步的 AsyncAuthenticator 共用，
+    子类需要提供 query_params、retry_policy 和 circuit_breaker。
+    """
+
+    __slots__ = ()
+
+    # 默认认证门户地址
+    DEFAULT_BASE_URL = "http://10.10.10.52"
+    INDEX_PATH = "/eportal/index.jsp"
+    STATUS_PATH = "/eportal/InterFace.do?method=getOnlineUserInfo"
+    LOGIN_PATH = "/eportal/InterFace.do?method=login"
+
+    # 跳转页面中认证页面地址的参数部分，如 index.jsp?wlanuserip=...'
+    QUERY_PATTERN = re.compile(rb"index\.jsp\?([^'\"\s<>]+)['\"\s<>]")
+    # 快速获取认证参数时最多跟随的跳转次数和读取的响应体字节数
+    PROBE_MAX_HOPS = 3
+    PROBE_MAX_BYTES = 4096
+    # 获取认证参数流程产出的请求：不跟随跳转只读取响应体开头 / 跟随跳转访问页面
+    STEP_PROBE = 'probe'
+    STEP_PAGE = 'page'
+    # 访问认证页面没有得到参数时，附带这些空参数再请求一次
+    LEGACY_PARAMS = {
+        'wlanuserip': '',
+        'wlanacname': '',
+        'ssid': '',
+        'nasip': '',
+        'mac': '',
+        'url': '',
+        't': 'wireless-v2'
+    }
+
+    def _use_portal(self, base_url):
+        """切换到指定门户"""
+        self.base_url = base_url
+        self.login_url = f"{self.base_url}{self.LOGIN_PATH}"
+
+    @staticmethod
+    def _parse_status(response):
+        """解析在线状态查询的响应为 OnlineUserInfo，响应不是JSON时抛出异常"""
+        return OnlineUserInfo.from_json(response.json())
+
+    def _probe_step(self, url, response):
+        """分析一次不跟随跳转的探测响应
+
+        返回 (queryString, None) 表示已找到参数，(None, 下一跳地址) 表示需要继续跳转，
+        (None, None) 表示没有找到；门户返回5xx时抛出 ServerError。
+        """
+        if response.status_code >= 500:
+            raise ServerError(f"HTTP {response.status_code}")
+        location = response.headers.get('Location')
+        if response.status_code in REDIRECT_CODES and location:
+            if '?' in location:
+                tracer.current().set(source='location')
+                return location.split('?', 1)[1], None
+            # 中间跳转，继续探测下一跳
+            return None, urljoin(url, location)
+        match = self.QUERY_PATTERN.search(response.content)
+        if match:
+            tracer.current().set(source='body')
+            return match.group(1).decode('utf-8', errors='replace'), None
+        return None, None
+
+    def _auth_page_steps(self):
+        """访问认证页面，得到带认证参数的地址；请求由 _discovery_steps 的调用方发送"""
+        auth_url = f"{self.base_url}{self.INDEX_PATH}"
+        response = yield (self.STEP_PAGE, auth_url, None)
+        logger.info(f"访问URL: {response.url}")
+        if '?' in response.url:
+            return response.url
+        # 如果没有参数，尝试获取重定向参数
+        tracer.current().incr('retries')
+        response = yield (self.STEP_PAGE, auth_url, self.LEGACY_PARAMS)
+        if '?' in response.url:
+            return response.url
+        logger.error("未获取到认证参数")
+        return None
+
+    def _discovery_steps(self, fast=True):
+        """获取queryString的流程，同步和异步版本共用，自身不发送请求
+
+        生成器依次产出要发送的请求 (STEP_PROBE, 地址, None) 或 (STEP_PAGE, 地址, 参数)，
+        通过 send(响应) 接收结果、throw(异常) 接收请求失败，最终返回queryString或None。
+        fast 为真时先不跟随跳转快速获取，失败时访问完整认证页面。
+        """
+        if fast:
+            url = f"{self.base_url}{self.INDEX_PATH}"
+            try:
+                logger.info("快速获取认证参数")
+                for _ in range(self.PROBE_MAX_HOPS):
+                    query_string, url = self._probe_step(url, (yield (self.STEP_PROBE, url, None)))
+                    if query_string:
+                        logger.info(f"认证queryString: {query_string}")
+                        return query_string
+                    if not url:
+                        break
+            except Exception as e:
+                logger.error(f"快速获取认证参数出错: {str(e)}")
+                if classify_exception(e) in (ERROR_TIMEOUT, ERROR_CONNECTION, ERROR_SERVER):
+                    # 网络或门户故障时访问完整认证页面也会失败，不再重复等待
+                    raise
+            logger.info("快速获取认证参数失败，访问完整认证页面")
+
+        tracer.current().set(source='legacy')
+        auth_url = yield from self._auth_page_steps()
+        if not auth_url:
+            return None
+        query_string = auth_url.split('?', 1)[1] if '?' in auth_url else ''
+        if not query_string:
+            logger.error("未获取到必要参数")
+            return None
+        logger.info(f"认证queryString: {query_string}")
+        return query_string
+
+    def _apply_query_params(self, query_string):
+        """用 query_params 替换queryString中的同名参数，其余参数原样保留"""
+        params = dict(self.query_params)
+        parts = []
+        for part in query_string.split('&'):
+            name = part.split('=', 1)[0]
+            parts.append(f"{name}={params.pop(name)}" if name in params else part)
+        parts.extend(f"{name}={value}" for name, value in params.items())
+        return '&'.join(parts)
+
+    def _login_form(self, username, password, query_string):
+        """登录请求的表单"""
+        if self.query_params:
+            query_string = self._apply_query_params(query_string)
+        return {
+            "userId": username,
+            "password": password,
+            "service": "",
+            "queryString": quote(query_string),
+            "passwordEncrypt": "false"
+        }
+
+    @staticmethod
+    def _parse_login_response(response):
+        """解析登录响应，返回 AuthResult"""
+        response.encoding = 'utf-8'
+        logger.info(f"登录响应状态码: {response.status_code}")
+
+        if response.status_code != 200:
+            logger.error("登录请求失败")
+            if response.status_code >= 500:
+                return AuthResult(False, AuthResult.SERVER_ERROR)
+            return AuthResult(False, AuthResult.FAILED)
+
+        try:
+            result = response.json()
+            success = result.get("result") == "success"
+            logger.info(f"登录结果: {'成功' if success else '失败'}")
+        except:
+            logger.error("解析登录响应失败")
+            return AuthResult(False, AuthResult.PROTOCOL)
+        if success:
+            return AuthResult(True, AuthResult.SUCCESS)
+        # 门户拒绝登录，如账号密码错误
+        logger.error(f"门户返回: {result.get('message', '')}")
+        return AuthResult(False, AuthResult.BAD_CREDENTIALS)
+
+    def _circuit_open(self):
+        """门户熔断中时返回 CIRCUIT_OPEN 结果，否则返回 None"""
+        if self.circuit_breaker.allow():
+            return None
+        logger.error(f"门户熔断中，{self.circuit_breaker.remaining():.0f} 秒后再试")
+        return AuthResult(False, AuthResult.CIRCUIT_OPEN)
+
+    def _should_retry(self, result, attempt):
+        """把第 attempt 次登录的结果记入熔断器，返回是否需要退避后重试"""
+        if result.success or result.reason in (AuthResult.BAD_CREDENTIALS, AuthResult.FAILED):
+            # 门户正常响应(包括拒绝登录)
+            self.circuit_breaker.record_success()
+            return False
+        if result.reason != AuthResult.UNREACHABLE:
+            self.circuit_breaker.record_failure()
+
+        if not self.retry_policy.should_retry(result.reason, attempt):
+            return False
+        logger.info(f"登录失败({result.reason})，第 {attempt} 次重试")
+        tracer.current().incr('retries')
+        return True
+
+
+class Authenticator(PortalProtocol):
+    # 登录的各个阶段，通过 progress 回调报告
+    PHASE_STATUS = 'status'
+    PHASE_DISCOVER = 'discover'
+    PHASE_LOGIN = 'login'
+
+    # 最近这么多秒内与门户通信成功过，就不再做连通性探测
+    REACHABLE_WINDOW = 10
+    # 连通性探测的尝试次数，每次的超时依次加倍；一个SYN丢失或刚连上Wi-Fi时的ARP延迟不判为不可达
+    REACHABILITY_ATTEMPTS = 2
+    # 更紧凑的请求头
+    HEADERS = {'User-Agent': 'Mozilla/5.0', 'Accept': '*/*'}
+
+    def __init__(self, base_url=None, keep_alive=True, pool_size=4, idle_timeout=30,
+                 query_cache=True, status_ttl=2, transport='requests', discovery='fast',
+                 connect_timeout=0.3, retry_policy=None, circuit_breaker=None, portals=None,
+                 query_params=None, cookie_jar=None, status_precheck=None):
+        # 门户地址列表，有多个时错开启动竞速，使用最先响应的门户；也可传入 PortalSelector 实例
+        if portals is None:
+            portals = [base_url or self.DEFAULT_BASE_URL]
+        if not isinstance(portals, PortalSelector):
+            portals = PortalSelector(portals)
+        self.portal_selector = portals
+        self._use_portal(portals.preferred())
         # 设置更短的超时时间
         self.timeout = 3
-        # 设置更紧凑的请求头
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0',
-            'Accept': '*/*',
-            'Connection': 'close'
-        })
+        # 登录前TCP连通性探测的超时(秒)，门户在局域网内，正常连接只需几毫秒
+        self.connect_timeout = connect_timeout
+        self._last_response_time = 0
+        # 传输后端：'requests'、'http.client'，或传入实现了 request()/close() 的对象
+        # 长连接模式复用到门户的TCP连接，keep_alive=False 时退回每次请求新建连接；
+        # 连接空闲超过 idle_timeout 秒后丢弃，避免复用已被门户关闭的连接
+        if isinstance(transport, str):
+            transport = create_transport(
+                transport,
+                headers=self.HEADERS,
+                keep_alive=keep_alive,
+                pool_size=pool_size,
+                idle_timeout=idle_timeout
+            )
+        self.transport = transport
+        # 认证参数获取方式：'fast' 只读跳转的 Location 头或响应体开头，失败时退回 'legacy'
+        # (跟随跳转并下载完整认证页面)
+        self.discovery = discovery
+        # 会话可能被界面线程和后台监测线程同时使用
+        self._lock = threading.RLock()
+        # 认证状态缓存：有效期内直接返回，同时发起的查询合并为一次请求
+        self.status_ttl = status_ttl
+        self._status_lock = threading.Lock()
+        self._status_value = False
+        # 最近一次查询得到的 OnlineUserInfo，查询失败时为 None
+        self._status_info = None
+        self._status_time = 0
+        self._status_generation = 0
+        self._status_inflight = None
+        # 认证参数缓存：True 使用默认缓存文件，也可传入 QueryStringCache 实例，None/False 关闭
+        if query_cache is True:
+            query_cache = QueryStringCache()
+        self.query_cache = query_cache or None
+        # 登录失败的重试策略和门户熔断器
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        # 登录时覆盖queryString中的参数，如批量认证时指定终端的 wlanuserip/mac
+        self.query_params = dict(query_params or {})
+        # 登录前是否先查询在线状态。不带参数的状态查询反映的是本机IP的状态，
+        # 为指定终端登录时不能据此判断；None 表示设置了 query_params 时不查询
+        self.status_precheck = not self.query_params if status_precheck is None else status_precheck
+        # 加密保存门户Cookie的 SessionCookieJar，重启后复用会话；None 表示不保存
+        # 保存的Cookie在首次请求时(工作线程中)载入，创建实例时不等待密钥就绪
+        self.cookie_jar = cookie_jar
+        self._cookies_loaded = cookie_jar is None or not hasattr(self.transport, 'import_cookies')
         
-    def check_status(self):
-        """检查当前认证状态"""
+    def _load_cookies(self):
+        """首次请求前载入保存的会话Cookie，调用方持有会话锁"""
+        if self._cookies_loaded:
+            return
+        self._cookies_loaded = True
         try:
-            status_url = f"{self.base_url}/eportal/InterFace.do?method=getOnlineUserInfo"
-            r = self.session.get(status_url, timeout=self.timeout)
-            r.close()  # 立即关闭连接
-            status = r.json()
-            return status.get('result') == 'success' and status.get('userIndex')
-        except:
+            self.transport.import_cookies(self.cookie_jar.load(self._cookie_key()))
+        except Exception as e:
+            logger.error(f"载入保存的会话失败: {str(e)}")
+        
+    def _request(self, method, url, **kwargs):
+        """通过传输后端发送请求"""
+        with self._lock:
+            self._load_cookies()
+            if not tracer.enabled:
+                response = self.transport.request(method, url, **kwargs)
+            else:
+                with tracer.span('http', method=method, path=urlparse(url).path) as span:
+                    response = self.transport.request(method, url, **kwargs)
+                    span.set(status=response.status_code, bytes=len(response.content))
+            self._last_response_time = time.monotonic()
+            return response
+
+    def _race_portals(self, attempt, timeout):
+        """对所有门户竞速执行 attempt(门户地址)，切换到最先成功的门户并返回其结果
+
+        全部失败时返回 None。期间持有会话锁，其他线程的请求等待竞速结束；
+        落后的竞速请求在竞速结束后仍会继续，attempt 不能使用会话的连接和Cookie。
+        """
+        with self._lock:
+            self._load_cookies()
+            with tracer.span('portal_race') as span:
+                outcome = self.portal_selector.race(attempt, timeout)
+                if outcome is None:
+                    span.set(ok=False)
+                    return None
+                base_url, result = outcome
+                span.set(ok=True, portal=base_url)
+                if base_url != self.base_url:
+                    logger.info(f"使用认证门户: {base_url}")
+                    self._use_portal(base_url)
+                self._last_response_time = time.monotonic()
+                return result
+
+    def _connect(self, base_url, timeout):
+        """TCP连接门户端口后立即关闭"""
+        url = urlparse(base_url)
+        # create_connection 在设置超时时使用非阻塞连接，最多等待 timeout 秒
+        socket.create_connection((url.hostname, url.port or 80), timeout=timeout).close()
+        return True
+
+    def is_reachable(self, timeout=None):
+        """快速检查门户端口能否连通
+
+        在 timeout 秒(默认 connect_timeout)内完成TCP连接即认为可达，失败时以加倍的超时再试，
+        共 REACHABILITY_ATTEMPTS 次；最近刚与门户通信成功过则直接返回True。
+        配置了多个门户时竞速连接，切换到最先连通的门户。
+        """
+        if (self._last_response_time
+                and time.monotonic() - self._last_response_time < self.REACHABLE_WINDOW):
+            return True
+        timeout = self.connect_timeout if timeout is None else timeout
+        if self.portal_selector.multiple:
+            # 最后一个门户在 stagger*(n-1) 秒后才启动，总超时相应延长
+            stagger = self.portal_selector.stagger * (len(self.portal_selector.portals) - 1)
+            for attempt in range(self.REACHABILITY_ATTEMPTS):
+                attempt_timeout = timeout * 2 ** attempt
+                if self._race_portals(lambda base_url: self._connect(base_url, attempt_timeout),
+                                      attempt_timeout + stagger):
+                    return True
+            logger.error("无法连接任何认证服务器")
+            return False
+        url = urlparse(self.base_url)
+        with tracer.span('reachability') as span:
+            for attempt in range(self.REACHABILITY_ATTEMPTS):
+                try:
+                    self._connect(self.base_url, timeout * 2 ** attempt)
+                    span.set(ok=True, attempts=attempt + 1)
+                    return True
+                except OSError as e:
+                    error = e
+            span.set(ok=False, attempts=self.REACHABILITY_ATTEMPTS)
+            logger.error(f"无法连接认证服务器 {url.netloc}: {str(error)}")
             return False
 
-    def get_auth_params(self):
-        """从当前URL中获取认证参数"""
+    def _fetch_prefix(self, url):
+        """不跟随跳转的GET请求，只读取响应体开头"""
+        with self._lock:
+            self._load_cookies()
+            with tracer.span('http', method='GET', path=urlparse(url).path, prefix=True) as span:
+                response = self.transport.fetch_prefix(
+                    url,
+                    timeout=self.timeout,
+                    max_bytes=self.PROBE_MAX_BYTES,
+                    until=self.QUERY_PATTERN.search
+                )
+                span.set(status=response.status_code, bytes=len(response.content))
+                return response
+
+    def close(self):
+        """关闭所有连接"""
+        with self._lock:
+            self.transport.close()
+
+    def check_status(self, max_age=None):
+        """检查当前认证状态
+
+        max_age 秒内(默认 status_ttl)查询过则直接返回缓存结果；
+        其他线程正在查询时等待其结果，不重复发送请求。
+        """
+        ttl = self.status_ttl if max_age is None else max_age
+        with self._status_lock:
+            if self._status_time and time.monotonic() - self._status_time <= ttl:
+                tracer.current().incr('status_cache_hits')
+                return self._status_value
+            inflight = self._status_inflight
+            leader = inflight is None
+            if leader:
+                inflight = self._status_inflight = threading.Event()
+                generation = self._status_generation
+
+        if not leader:
+            inflight.wait(self.timeout + 1)
+            with self._status_lock:
+                return self._status_value
+
+        info = None
         try:
-            logger.info("开始获取认证参数")
-            
-            # 获取认证页面
-            logger.info("获取认证页面")
-            auth_url = f"{self.base_url}/eportal/index.jsp"
-            response = self.session.get(auth_url, timeout=5)
-            logger.info(f"访问URL: {response.url}")
-            
-            # 从URL中获取认证参数
-            if '?' in response.url:
-                return response.url
-            
-            # 如果没有参数，尝试获取重定向参数
-            params = {
-                'wlanuserip': '',
-                'wlanacname': '',
-                'ssid': '',
-                'nasip': '',
-                'mac': '',
-                'url': '',
-                't': 'wireless-v2'
-            }
-            response = self.session.get(auth_url, params=params, timeout=5)
-            if '?' in response.url:
-                return response.url
-            
-            logger.error("未获取到认证参数")
+            info = self._fetch_status()
+        finally:
+            with self._status_lock:
+                # 查询期间缓存被清除(如刚登录)时不写入旧结果
+                if generation == self._status_generation:
+                    self._status_info = info
+                    self._status_value = bool(info)
+                    self._status_time = time.monotonic()
+                self._status_inflight = None
+            inflight.set()
+        return bool(info)
+
+    def online_info(self, max_age=None):
+        """在线信息 OnlineUserInfo，与 check_status 共用缓存；查询失败时返回 None"""
+        self.check_status(max_age)
+        return self.cached_online_info()
+
+    def cached_online_info(self):
+        """缓存中的在线信息，不发送请求；没有缓存时返回 None"""
+        with self._status_lock:
+            return self._status_info if self._status_time else None
+
+    @traced('status')
+    def _fetch_status(self):
+        """请求门户查询在线状态，返回 OnlineUserInfo；配置了多个门户时竞速查询"""
+        try:
+            if self.portal_selector.multiple:
+                with self._lock:
+                    self._load_cookies()
+                    cookies = self.transport.export_cookies()
+                return self._race_portals(lambda base_url: self._query_status(base_url, cookies),
+                                          self.timeout)
+            r = self._request('GET', f"{self.base_url}{self.STATUS_PATH}", timeout=self.timeout)
+            return self._parse_status(r)
+        except:
             return None
-            
+
+    def _query_status(self, base_url, cookies):
+        """竞速时向指定门户查询在线状态，响应无效时抛出异常
+
+        使用带 cookies 的一次性短连接，落后的请求不会占用会话的连接或修改其Cookie。
+        """
+        transport = create_transport(getattr(self.transport, 'name', 'http.client'),
+                                     headers=self.HEADERS, keep_alive=False)
+        try:
+            transport.import_cookies(cookies)
+            response = transport.request('GET', f"{base_url}{self.STATUS_PATH}",
+                                         timeout=self.timeout)
+            return self._parse_status(response)
+        finally:
+            transport.close()
+
+    def status_snapshot(self):
+        """最近一次状态查询的结果和距今秒数，缓存为空时返回 (False, None)"""
+        with self._status_lock:
+            if not self._status_time:
+                return False, None
+            return self._status_value, time.monotonic() - self._status_time
+
+    def invalidate_status(self):
+        """清除认证状态缓存，登录/下线后调用"""
+        with self._status_lock:
+            self._status_time = 0
+            self._status_generation += 1
+
+    def get_auth_params(self, raise_errors=False):
+        """从当前URL中获取认证参数，raise_errors 为真时请求异常向上抛出"""
+        try:
+            logger.info("开始获取认证参数")
+            return self._run_steps(self._auth_page_steps())
         except Exception as e:
             logger.error(f"获取认证参数时出错: {str(e)}")
+            if raise_errors:
+                raise
             return None
         
-    def login(self, username, password):
+    def _enter_phase(self, phase, progress, cancel_event):
+        """进入登录的下一阶段：检查是否已取消并报告进度"""
+        if cancel_event is not None and cancel_event.is_set():
+            logger.info("登录已取消")
+            raise AuthCancelled()
+        if progress:
+            progress(phase)
+
+    @traced('login')
+    def login(self, username, password, progress=None, cancel_event=None):
+        """登录认证，返回 AuthResult
+
+        超时、连接错误、服务器5xx等按 retry_policy 退避重试，账号密码错误不重试；
+        连续失败触发熔断后，冷却期内直接返回 CIRCUIT_OPEN。
+        progress(phase) 在每个阶段开始时调用；cancel_event 被设置后，
+        在下一阶段开始前抛出 AuthCancelled（已发出的请求无法中断）。
+        """
+        attempt = 0
+        while True:
+            circuit_open = self._circuit_open()
+            if circuit_open:
+                return circuit_open
+
+            attempt += 1
+            result = self._login_once(username, password, progress, cancel_event)
+            if not self._should_retry(result, attempt):
+                return result
+            if not self.retry_policy.wait(attempt, cancel_event):
+                raise AuthCancelled()
+
+    def _login_once(self, username, password, progress, cancel_event):
+        """执行一次完整的登录流程"""
         try:
+            # 门户不可达时立即返回，不再等待各个请求超时
+            if not self.is_reachable():
+                return AuthResult(False, AuthResult.UNREACHABLE)
+
             # 检查认证状态
-            try:
-                status_url = f"{self.base_url}/eportal/InterFace.do?method=getOnlineUserInfo"
-                r = self.session.get(status_url, timeout=5)
-                status = r.json()
-                if status.get('result') == 'success' and status.get('userIndex'):
-                    logger.info("已经认证，无需重复登录")
-                    return True
-            except:
-                pass
-
-            # 获取登录页面
-            auth_url = self.get_auth_params()
-            if not auth_url:
-                logger.error("未获取到认证参数")
-                return False
-            
-            query_string = auth_url.split('?', 1)[1] if '?' in auth_url else ''
+            self._enter_phase(self.PHASE_STATUS, progress, cancel_event)
+            if self.status_precheck and self.check_status():
+                logger.info("已经认证，无需重复登录")
+                return AuthResult(True, AuthResult.ALREADY_ONLINE)
+
+            # 优先使用缓存的认证参数，省去获取认证页面的请求
+            network_key = self._network_identity()
+            query_string = self.query_cache.get(network_key) if self.query_cache else None
+            if query_string:
+                logger.info("使用缓存的认证参数")
+                tracer.current().set(query_cache='hit')
+                self._enter_phase(self.PHASE_LOGIN, progress, cancel_event)
+                try:
+                    result = self._send_login(username, password, query_string)
+                except Exception:
+                    # 无法确定缓存的参数是否仍然有效，下次登录重新获取
+                    self.query_cache.invalidate(network_key)
+                    raise
+                if result:
+                    self._update_cookie_jar(result)
+                    return result
+                # 门户拒绝的原因可能是缓存的参数或保存的会话已失效，清除后重新获取一次
+                logger.info("使用缓存参数登录失败，重新获取认证参数")
+                self.query_cache.invalidate(network_key)
+                self._discard_cookies()
+                tracer.current().incr('retries')
+
+            self._enter_phase(self.PHASE_DISCOVER, progress, cancel_event)
+            query_string = self._discover_query_string()
             if not query_string:
-                logger.error("未获取到必要参数")
-                return False
-            
-            logger.info(f"认证queryString: {query_string}")
-            
-            # 发送登录请求
-            data = {
-                "userId": username,
-                "password": password,
-                "service": "",
-                "queryString": quote(query_string),
-                "passwordEncrypt": "false"
-            }
-            
-            logger.info(f"发送登录请求: {self.login_url}")
-            
-            response = self.session.post(self.login_url, data=data, headers=self.session.headers, timeout=5)
-            response.encoding = 'utf-8'
-            logger.info(f"登录响应状态码: {response.status_code}")
-            
-            if response.status_code != 200:
-                logger.error("登录请求失败")
-                return False
-            
-            try:
-                result = response.json()
-                success = result.get("result") == "success"
-                logger.info(f"登录结果: {'成功' if success else '失败'}")
-                return success
-            except:
-                logger.error("解析登录响应失败")
-                return False
-            
+                return AuthResult(False, AuthResult.NO_PARAMS)
+
+            self._enter_phase(self.PHASE_LOGIN, progress, cancel_event)
+            result = self._send_login(username, password, query_string)
+            if result and self.query_cache:
+                self.query_cache.put(network_key, query_string)
+            self._update_cookie_jar(result)
+            return result
+
+        except AuthCancelled:
+            raise
         except Exception as e:
             logger.error(f"认证出错: {str(e)}")
-            return False 
\ No newline at end of file
+            return AuthResult(False, classify_exception(e))
+
+    def _run_steps(self, steps):
+        """发送 _discovery_steps 等流程产出的请求，返回流程的结果"""
+        try:
+            step = next(steps)
+            while True:
+                kind, url, params = step
+                try:
+                    if kind == self.STEP_PROBE:
+                        response = self._fetch_prefix(url)
+                    else:
+                        response = self._request('GET', url, params=params, timeout=5)
+                except Exception as e:
+                    step = steps.throw(e)
+                else:
+                    step = steps.send(response)
+        except StopIteration as stop:
+            return stop.value
+
+    @traced('discover')
+    def _discover_query_string(self):
+        """访问认证页面获取queryString"""
+        fast = self.discovery == 'fast' and hasattr(self.transport, 'fetch_prefix')
+        return self._run_steps(self._discovery_steps(fast))
+
+    @traced('login_post')
+    def _send_login(self, username, password, query_string):
+        """发送登录请求，返回 AuthResult"""
+        data = self._login_form(username, password, query_string)
+
+        logger.info(f"发送登录请求: {self.login_url}")
+
+        try:
+            response = self._request('POST', self.login_url, data=data, timeout=5)
+        finally:
+            # 登录请求可能已改变在线状态
+            self.invalidate_status()
+        return self._parse_login_response(response)
+
+    def _cookie_key(self):
+        return urlparse(self.base_url).netloc
+
+    def _update_cookie_jar(self, result):
+        """登录成功后保存会话Cookie，门户拒绝登录时丢弃"""
+        if self.cookie_jar is None or not hasattr(self.transport, 'export_cookies'):
+            return
+        if result:
+            self.cookie_jar.save(self._cookie_key(), self.transport.export_cookies())
+        elif result.reason in (AuthResult.BAD_CREDENTIALS, AuthResult.FAILED, AuthResult.PROTOCOL):
+            self._discard_cookies()
+
+    def _discard_cookies(self):
+        """丢弃当前会话的Cookie，下次请求建立新会话"""
+        if self.cookie_jar is None or not hasattr(self.transport, 'clear_cookies'):
+            return
+        self.transport.clear_cookies()
+        self.cookie_jar.discard(self._cookie_key())
+
+    def _network_identity(self):
+        """当前网络标识：本机出口IP + 门户地址"""
+        host = urlparse(self.base_url).hostname
+        try:
+            # UDP connect 不发送数据，只用来确定到门户的出口地址
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+                s.connect((host, 80))
+                local_ip = s.getsockname()[0]
+        except OSError:
+            local_ip = ''
+        return f"{local_ip}->{urlparse(self.base_url).netloc}"
+
+
+class QueryStringCache:
+    """按网络标识持久化缓存门户的queryString"""
+
+    def __init__(self, cache_file=None, ttl=24 * 3600):
+        self.cache_file = cache_file or Path.home() / '.campus_network' / 'query_cache.json'
+        # 缓存有效期(秒)
+        self.ttl = ttl
+        self._entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except:
+            return {}
+
+    def _save(self):
+        try:
+            write_atomic(self.cache_file,
+                         json.dumps(self._entries, separators=(',', ':')).encode('utf-8'))
+        except Exception as e:
+            logger.error(f"保存认证参数缓存失败: {str(e)}")
+
+    def get(self, key):
+        """获取未过期的queryString"""
+        entry = self._entries.get(key)
+        if not entry:
+            return None
+        if time.time() - entry.get('time', 0) > self.ttl:
+            self.invalidate(key)
+            return None
+        return entry.get('query_string')
+
+    def put(self, key, query_string):
+        """保存queryString"""
+        entry = self._entries.get(key)
+        if entry and entry.get('query_string') == query_string:
+            # 参数未变化时只在快过期时刷新时间，避免每次登录都写文件
+            if time.time() - entry.get('time', 0) < self.ttl / 2:
+                return
+        self._entries[key] = {'query_string': query_string, 'time': time.time()}
+        self._save()
+
+    def invalidate(self, key):
+        """使缓存失效"""
+        if self._entries.pop(key, None) is not None:
+            self._save()
+
+
+class SessionCookieJar:
+    """加密保存门户的会话Cookie，重启或重新登录时复用会话
+
+    使用 Config.cipher 加密后写入文件。带过期时间的Cookie按其过期时间失效，
+    会话Cookie(如JSESSIONID)保存超过 session_ttl 秒后不再使用。
+    cipher 也可以是尚未完成的 Future(如 Config.cipher_future)，文件在首次使用时读取。
+    """
+
+    def __init__(self, cipher, jar_file=None, session_ttl=1800):
+        self._cipher = cipher
+        self.jar_file = jar_file or Path.home() / '.campus_network' / 'cookies.bin'
+        self.session_ttl = session_ttl
+        self._loaded_entries = None
+
+    @property
+    def cipher(self):
+        return self._cipher.result() if isinstance(self._cipher, Future) else self._cipher
+
+    @property
+    def _entries(self):
+        if self._loaded_entries is None:
+            self._loaded_entries = self._load()
+        return self._loaded_entries
+
+    def _load(self):
+        try:
+            with open(self.jar_file, 'rb') as f:
+                return json.loads(self.cipher.decrypt(f.read()))
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            # 密钥变化或文件损坏，丢弃整个文件
+            logger.error(f"读取保存的会话失败: {str(e)}")
+            self._remove_file()
+            return {}
+
+    def _save(self):
+        try:
+            data = json.dumps(self._entries, separators=(',', ':')).encode('utf-8')
+            write_atomic(self.jar_file, self.cipher.encrypt(data))
+        except Exception as e:
+            logger.error(f"保存会话失败: {str(e)}")
+
+    def _remove_file(self):
+        try:
+            Path(self.jar_file).unlink()
+        except OSError:
+            pass
+
+    def load(self, key):
+        """返回门户 key 下未过期的Cookie列表"""
+        entry = self._entries.get(key)
+        if not entry:
+            return []
+        now = time.time()
+        session_valid = now - entry.get('time', 0) <= self.session_ttl
+        cookies = [c for c in entry.get('cookies', [])
+                   if (c.get('expires') is None and session_valid)
+                   or (c.get('expires') is not None and c['expires'] > now)]
+        if cookies:
+            logger.info(f"复用保存的会话Cookie: {len(cookies)} 个")
+        return cookies
+
+    def save(self, key, cookies):
+        """保存门户 key 的Cookie列表"""
+        if not cookies:
+            self.discard(key)
+            return
+        self._entries[key] = {'cookies': cookies, 'time': time.time()}
+        self._save()
+
+    def discard(self, key):
+        """丢弃门户 key 的Cookie"""
+        if self._entries.pop(key, None) is not None:
+            logger.info("丢弃保存的会话Cookie")
+            self._save()
@@ -0,0 +1,59 @@
+import threading
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from auth import AuthCancelled
+from logger import logger
+
+
+class AuthTaskSignals(QObject):
+    """认证任务的信号，在界面线程中触发"""
+    progress = pyqtSignal(str)
+    finished = pyqtSignal(object)
+    cancelled = pyqtSignal()
+
+
+class AuthTask(QRunnable):
+    """在线程池中执行认证相关的网络请求，避免阻塞界面线程
+
+    fn(progress, cancel_event) 在工作线程中执行，不能访问任何界面控件；
+    返回值通过 finished 信号传回界面线程。
+    """
+
+    def __init__(self, fn):
+        super().__init__()
+        self.fn = fn
+        self.signals = AuthTaskSignals()
+        self.cancel_event = threading.Event()
+        self.done = False
+
+    def cancel(self):
+        """取消任务，结果将被丢弃"""
+        self.cancel_event.set()
+
+    def is_cancelled(self):
+        return self.cancel_event.is_set()
+
+    def run(self):
+        result = None
+        try:
+            result = self.fn(self.signals.progress.emit, self.cancel_event)
+        except AuthCancelled:
+            pass
+        except Exception as e:
+            logger.error(f"认证任务出错: {str(e)}")
+        self.done = True
+        if self.cancel_event.is_set():
+            self.signals.cancelled.emit()
+        else:
+            self.signals.finished.emit(result)
+
+
+def run_auth_task(fn, on_finished, on_progress=None, on_cancelled=None):
+    """在全局线程池中启动认证任务，返回任务对象以便取消"""
+    task = AuthTask(fn)
+    task.signals.finished.connect(on_finished)
+    if on_progress:
+        task.signals.progress.connect(on_progress)
+    if on_cancelled:
+        task.signals.cancelled.connect(on_cancelled)
+    QThreadPool.globalInstance().start(task)
+    return task
@@ -0,0 +1,150 @@
+import csv
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from auth import Authenticator, AuthResult
+from logger import logger
+
+# 账号列表中可选的认证参数列，登录时覆盖门户下发的queryString中的同名参数
+QUERY_PARAM_FIELDS = ('wlanuserip', 'mac')
+
+
+def load_accounts(path):
+    """读取账号列表：CSV(首行为列名)或JSON数组
+
+    每个账号至少包含 username、password，可选 portal 以及 wlanuserip、mac 参数。
+    """
+    path = Path(path)
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        if path.suffix.lower() == '.json':
+            rows = json.load(f)
+        else:
+            rows = list(csv.DictReader(f))
+    accounts = []
+    for index, row in enumerate(rows, 1):
+        if not row.get('username') or not row.get('password'):
+            raise ValueError(f"第 {index} 个账号缺少 username 或 password")
+        accounts.append({key: str(value).strip() for key, value in row.items()
+                         if key and value not in (None, '')})
+    return accounts
+
+
+class RateLimiter:
+    """令牌桶限速：平均每秒 rate 次，最多连续 burst 次"""
+
+    def __init__(self, rate, burst=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取得一个令牌，返回等待的秒数"""
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # 先预留令牌，令牌不足时按欠下的数量排队等待
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            self.sleep(wait)
+        return wait
+
+
+class BatchResult:
+    """单个账号的认证结果"""
+
+    __slots__ = ('username', 'portal', 'result', 'elapsed', 'waited')
+
+    def __init__(self, username, portal, result, elapsed, waited):
+        self.username = username
+        self.portal = portal
+        self.result = result
+        # 登录耗时和等待限速的时间(秒)
+        self.elapsed = elapsed
+        self.waited = waited
+
+    def __bool__(self):
+        return bool(self.result)
+
+
+class BatchAuthenticator:
+    """并发认证多个账号/终端
+
+    每个账号使用独立的 Authenticator 会话，在线程池中执行与 Authenticator.login 相同的登录流程。
+    concurrency 限制同时进行的登录数，rate 限制每个门户每秒开始的登录数(None 表示不限速)。
+    """
+
+    def __init__(self, concurrency=8, rate=None, burst=1, portals=None, transport='http.client',
+                 **auth_options):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        # 账号未指定 portal 时使用的门户
+        self.portals = portals
+        self.transport = transport
+        # 各会话同时写同一个缓存文件不安全，默认不使用认证参数缓存
+        auth_options.setdefault('query_cache', None)
+        # 门户的状态查询只反映本机，本机在线后其余账号会被误判为已在线，登录前不查询
+        auth_options.setdefault('status_precheck', False)
+        self.auth_options = auth_options
+        self._limiters = {}
+        self._limiters_lock = threading.Lock()
+
+    def _limiter(self, portal):
+        with self._limiters_lock:
+            if portal not in self._limiters:
+                self._limiters[portal] = RateLimiter(self.rate, self.burst)
+            return self._limiters[portal]
+
+    def _login(self, account):
+        portals = [account['portal']] if account.get('portal') else self.portals
+        auth = Authenticator(
+            portals=portals,
+            transport=self.transport,
+            query_params={field: account[field] for field in QUERY_PARAM_FIELDS if field in account},
+            **self.auth_options
+        )
+        waited = self._limiter(auth.base_url).acquire() if self.rate else 0
+        start = time.perf_counter()
+        try:
+            result = auth.login(account['username'], account['password'])
+        except Exception as e:
+            logger.error(f"批量认证 {account['username']} 出错: {str(e)}")
+            result = AuthResult(False, AuthResult.ERROR)
+        finally:
+            auth.close()
+        return BatchResult(account['username'], auth.base_url, result,
+                           time.perf_counter() - start, waited)
+
+    def run(self, accounts, on_result=None):
+        """认证所有账号，按输入顺序返回 BatchResult 列表
+
+        on_result(BatchResult) 在每个账号完成时于工作线程中调用。
+        """
+        def task(account):
+            result = self._login(account)
+            if on_result:
+                on_result(result)
+            return result
+
+        with ThreadPoolExecutor(max_workers=self.concurrency,
+                                thread_name_prefix='BatchAuth') as executor:
+            return list(executor.map(task, accounts))
+
+
+def format_results(results):
+    """把结果格式化为表格文本"""
+    lines = [f"{'账号':<20}{'门户':<28}{'结果':<16}{'耗时(ms)':>10}{'限速等待(ms)':>14}"]
+    for item in results:
+        lines.append(f"{item.username:<20}{item.portal:<28}{item.result.reason:<16}"
+                     f"{item.elapsed * 1000:>10.1f}{item.waited * 1000:>14.1f}")
+    succeeded = sum(1 for item in results if item)
+    lines.append(f"成功 {succeeded}/{len(results)}")
+    return '\n'.join(lines)
@@ -0,0 +1,900 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from mock_portal import MockPortal
+from retry import RetryPolicy
+
+
+def bench_keepalive(args):
+    """对比长连接与短连接模式的建立连接数和耗时"""
+    from auth import Authenticator
+
+    print(f"{'模式':<12}{'连接数/次':>10}{'平均耗时(ms)':>14}")
+    with MockPortal(connect_latency=args.connect_latency) as portal:
+        for keep_alive in (True, False):
+            auth = Authenticator(base_url=portal.base_url, keep_alive=keep_alive,
+                                 query_cache=None)
+            portal.reset()
+            elapsed = 0.0
+            for _ in range(args.rounds):
+                portal.online_users.clear()
+                start = time.perf_counter()
+                if not auth.login('test', 'test'):
+                    raise SystemExit("登录失败")
+                elapsed += time.perf_counter() - start
+            auth.close()
+            mode = 'keep-alive' if keep_alive else 'close'
+            conns = portal.stats['connections'] / args.rounds
+            print(f"{mode:<12}{conns:>10.1f}{elapsed / args.rounds * 1000:>14.1f}")
+
+
+# 子进程中从导入认证模块到认证成功的耗时
+_COLD_LOGIN_SNIPPET = """
+import sys, time
+start = time.perf_counter()
+from auth import Authenticator
+auth = Authenticator(base_url=sys.argv[1], transport=sys.argv[2], query_cache=None)
+ok = auth.login('test', 'test')
+print(time.perf_counter() - start if ok else -1)
+"""
+
+
+def _check_transport_behaviour(name, portal):
+    """在模拟门户上验证传输后端的认证行为，返回错误描述列表"""
+    from auth import Authenticator
+
+    errors = []
+    portal.reset()
+    auth = Authenticator(base_url=portal.base_url, transport=name, query_cache=None)
+    if auth.check_status():
+        errors.append("未登录时状态应为未认证")
+    query_string = auth._discover_query_string()
+    if query_string != portal.query_string:
+        errors.append(f"跳转后获取的参数不正确: {query_string}")
+    if auth.login('test', 'wrong'):
+        errors.append("错误密码不应登录成功")
+    if not auth.login('test', 'test'):
+        errors.append("正确密码应登录成功")
+    if not auth.check_status(max_age=0):
+        errors.append("登录后状态应为已认证")
+    auth.close()
+    return errors
+
+
+def bench_transport(args):
+    """对比各传输后端的行为一致性和冷启动到认证成功的耗时，行为检查失败时返回非零退出码"""
+    from transport import TRANSPORTS
+
+    failed = []
+    print(f"{'后端':<14}{'行为检查':>8}{'认证耗时(ms)':>14}{'进程总耗时(ms)':>16}")
+    with MockPortal() as portal:
+        for name in TRANSPORTS:
+            errors = _check_transport_behaviour(name, portal)
+            login_ms = total_ms = 0.0
+            for _ in range(args.rounds):
+                portal.reset()
+                start = time.perf_counter()
+                result = subprocess.run(
+                    [sys.executable, '-c', _COLD_LOGIN_SNIPPET, portal.base_url, name],
+                    capture_output=True, text=True
+                )
+                total_ms += (time.perf_counter() - start) * 1000
+                elapsed = float(result.stdout.strip() or -1)
+                if elapsed < 0:
+                    raise SystemExit(f"{name} 登录失败: {result.stderr}")
+                login_ms += elapsed * 1000
+            status = '通过' if not errors else '失败'
+            print(f"{name:<14}{status:>8}{login_ms / args.rounds:>14.1f}{total_ms / args.rounds:>16.1f}")
+            for error in errors:
+                print(f"  - {error}")
+            if errors:
+                failed.append(name)
+    if failed:
+        print(f"失败: {', '.join(failed)} 的行为检查未通过", file=sys.stderr)
+        return 1
+    return 0
+
+
+# 子进程中打印峰值内存(KB)
+_PEAK_RSS_SNIPPET = """
+try:
+    import resource
+    print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+except ImportError:
+    import psutil
+    print(psutil.Process().memory_info().peak_wset // 1024)
+"""
+
+
+def _import_cost(module):
+    """在新进程中导入模块，返回 (导入耗时ms, 峰值内存MB)"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        return None, None
+    # 只累加顶层导入(名称前没有缩进)的累计耗时
+    total_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if not name[1:].startswith(' '):
+            total_us += int(cumulative)
+
+    result = subprocess.run(
+        [sys.executable, '-c', f"import {module}\n{_PEAK_RSS_SNIPPET}"],
+        capture_output=True, text=True
+    )
+    rss_mb = int(result.stdout.strip().splitlines()[-1]) / 1024 if result.returncode == 0 else None
+    return total_us / 1000, rss_mb
+
+
+def bench_importtime(args):
+    """对比命令行入口与图形界面入口的导入耗时和内存"""
+    print(f"{'入口':<10}{'导入耗时(ms)':>14}{'峰值内存(MB)':>14}")
+    for module in args.modules:
+        import_ms, rss_mb = _import_cost(module)
+        if import_ms is None:
+            print(f"{module:<10}{'导入失败':>14}")
+            continue
+        print(f"{module:<10}{import_ms:>14.1f}{rss_mb:>14.1f}")
+
+
+def _percentiles(samples):
+    """返回 (p50, p95, p99)，单位毫秒"""
+    if len(samples) < 2:
+        value = samples[0] * 1000 if samples else 0.0
+        return value, value, value
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return cuts[49] * 1000, cuts[94] * 1000, cuts[98] * 1000
+
+
+def bench_latency(args):
+    """登录和状态查询的延迟分布、每次登录的请求数和传输字节数"""
+    from auth import Authenticator, QueryStringCache
+
+    portal = MockPortal(latency=args.latency, latency_jitter=args.jitter,
+                        error_rate=args.error_rate, redirect_shape=args.redirect)
+    with portal:
+        query_cache = QueryStringCache(cache_file=args.cache_file) if args.query_cache else None
+        auth = Authenticator(base_url=portal.base_url, transport=args.transport,
+                             query_cache=query_cache, discovery=args.discovery)
+
+        login_times = []
+        failures = 0
+        portal.reset()
+        for _ in range(args.rounds):
+            portal.online_users.clear()
+            auth.invalidate_status()
+            start = time.perf_counter()
+            if auth.login('test', 'test'):
+                login_times.append(time.perf_counter() - start)
+            else:
+                failures += 1
+        login_stats = dict(portal.stats)
+
+        status_times = []
+        portal.reset()
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            auth.check_status(max_age=0)
+            status_times.append(time.perf_counter() - start)
+        status_stats = dict(portal.stats)
+        auth.close()
+
+    print(f"传输后端: {args.transport}  跳转方式: {args.redirect}  参数获取: {args.discovery}  "
+          f"认证参数缓存: {'开' if args.query_cache else '关'}  轮数: {args.rounds}")
+    print(f"{'':<10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}"
+          f"{'请求数/次':>10}{'发送B/次':>10}{'接收B/次':>10}")
+    for name, samples, stats in (('登录', login_times, login_stats),
+                                 ('状态查询', status_times, status_stats)):
+        p50, p95, p99 = _percentiles(samples)
+        print(f"{name:<10}{p50:>10.2f}{p95:>10.2f}{p99:>10.2f}"
+              f"{stats['requests'] / args.rounds:>10.2f}"
+              f"{stats['bytes_received'] / args.rounds:>10.0f}"
+              f"{stats['bytes_sent'] / args.rounds:>10.0f}")
+    print(f"登录成功率: {(args.rounds - failures) / args.rounds:.1%}  "
+          f"各接口请求数: {dict(login_stats['endpoints'])}")
+
+
+def bench_tracing(args):
+    """追踪关闭/开启时每次调用的额外开销"""
+    import timeit
+    from tracing import tracer, traced
+
+    def plain():
+        return True
+
+    wrapped = traced('bench')(plain)
+    tracer.log_records = False
+    base = timeit.timeit(plain, number=args.number)
+    results = [('无追踪', base)]
+    for enabled in (False, True):
+        tracer.enable(enabled)
+        results.append(('追踪开启' if enabled else '追踪关闭', timeit.timeit(wrapped, number=args.number)))
+    tracer.enable(False)
+    tracer.clear()
+
+    print(f"{'':<10}{'每次调用(ns)':>14}{'额外开销(ns)':>14}")
+    for name, total in results:
+        per_call = total / args.number * 1e9
+        print(f"{name:<10}{per_call:>14.0f}{per_call - base / args.number * 1e9:>14.0f}")
+
+
+def _run_herd(portal, clients, window, jitter):
+    """同时启动 clients 个客户端登录，返回 (成功数, 全部成功耗时, 门户统计)"""
+    from auth import Authenticator
+    from startup_stagger import staggered_login
+
+    portal.reset()
+    start_gate = threading.Event()
+    finish_times = []
+    lock = threading.Lock()
+
+    def client(index):
+        auth = Authenticator(base_url=portal.base_url, transport='http.client', query_cache=None)
+        start_gate.wait()
+        try:
+            ok = staggered_login(auth, 'test', 'test', f"client-{index}", window, jitter)
+        except Exception:
+            ok = False
+        finally:
+            auth.close()
+        if ok:
+            with lock:
+                finish_times.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    start = time.perf_counter()
+    start_gate.set()
+    for thread in threads:
+        thread.join()
+    return len(finish_times), max(finish_times, default=0.0), dict(portal.stats)
+
+
+def bench_herd(args):
+    """模拟机房大量机器同时开机登录，对比错峰前后门户的负载和登录成功率"""
+    portal = MockPortal(latency=args.latency, max_concurrent=args.capacity,
+                        overload_latency=args.overload_latency)
+    print(f"客户端: {args.clients}  门户并发上限: {args.capacity}  "
+          f"处理耗时: {args.latency * 1000:.0f}ms")
+    print(f"{'模式':<16}{'成功率':>8}{'全部在线(s)':>12}{'请求数':>8}{'被拒绝':>8}")
+    with portal:
+        for name, window, jitter in (('同时登录', 0, 0),
+                                     (f'错峰{args.window:g}s', args.window, args.jitter)):
+            ok, elapsed, stats = _run_herd(portal, args.clients, window, jitter)
+            print(f"{name:<16}{ok / args.clients:>8.0%}{elapsed:>12.2f}"
+                  f"{stats['requests']:>8}{stats['rejected']:>8}")
+
+
+def bench_portals(args):
+    """主门户无响应时，单门户、多门户竞速(首次/记住胜出者)的登录耗时"""
+    from auth import Authenticator
+    from portal_race import PortalSelector
+
+    state_file = Path(tempfile.gettempdir()) / 'bench_portal_state.json'
+    state_file.unlink(missing_ok=True)
+    # 主门户接受连接但不响应，模拟门户进程卡死
+    dead = MockPortal(latency=60)
+    healthy = MockPortal(latency=args.latency)
+    with dead, healthy:
+        cases = (
+            ('单门户(主门户故障)', [dead.base_url], 1),
+            ('竞速(首次)', [dead.base_url, healthy.base_url], 1),
+            ('竞速(记住胜出者)', [dead.base_url, healthy.base_url], args.rounds),
+        )
+        print(f"{'模式':<20}{'成功率':>8}{'平均耗时(ms)':>14}")
+        for name, portals, rounds in cases:
+            ok = 0
+            elapsed = 0.0
+            for _ in range(rounds):
+                healthy.online_users.clear()
+                selector = PortalSelector(portals, stagger=args.stagger, state_file=state_file)
+                auth = Authenticator(portals=selector, transport='http.client', query_cache=None,
+                                     retry_policy=RetryPolicy(max_attempts=1))
+                start = time.perf_counter()
+                ok += bool(auth.login('test', 'test'))
+                elapsed += time.perf_counter() - start
+                auth.close()
+            print(f"{name:<20}{ok / rounds:>8.0%}{elapsed / rounds * 1000:>14.1f}")
+    state_file.unlink(missing_ok=True)
+
+
+def bench_batch(args):
+    """批量认证在不同并发数下的总耗时和单次登录延迟"""
+    from batch_auth import BatchAuthenticator
+
+    accounts = [{'username': f"user{i}", 'password': 'secret',
+                 'wlanuserip': f"10.20.{i // 250}.{i % 250 + 1}"} for i in range(args.accounts)]
+    portal = MockPortal(accounts={a['username']: a['password'] for a in accounts},
+                        latency=args.latency, max_concurrent=args.capacity, track_by_ip=True)
+    print(f"账号: {args.accounts}  门户处理耗时: {args.latency * 1000:.0f}ms  "
+          f"限速: {args.rate or '不限'}/s")
+    print(f"{'并发数':<8}{'成功率':>8}{'终端在线':>8}{'总耗时(s)':>10}{'登录/s':>8}"
+          f"{'p50(ms)':>10}{'p95(ms)':>10}")
+    with portal:
+        for concurrency in args.concurrency:
+            portal.reset()
+            # 运行批量认证的主机本身已在线，状态查询对所有会话都返回在线
+            portal.online_users[portal.host_ip] = 'test'
+            batch = BatchAuthenticator(concurrency=concurrency, rate=args.rate,
+                                       burst=concurrency, portals=[portal.base_url])
+            start = time.perf_counter()
+            results = batch.run(accounts)
+            total = time.perf_counter() - start
+            ok = sum(1 for item in results if item)
+            # 门户上实际登录成功的终端数，不含主机本身
+            online = sum(1 for a in accounts if a['wlanuserip'] in portal.online_users)
+            p50, p95, _ = _percentiles([item.elapsed for item in results])
+            print(f"{concurrency:<8}{ok / len(results):>8.0%}{online:>8}{total:>10.2f}"
+                  f"{len(results) / total:>8.1f}{p50:>10.1f}{p95:>10.1f}")
+
+
+def _async_sessions(base_url, count):
+    """一个事件循环同时登录 count 个异步会话，返回 (成功数, 耗时, 登录后保持连接时的内存)"""
+    import asyncio
+    from async_auth import AsyncAuthenticator
+
+    async def run():
+        sessions = [AsyncAuthenticator(base_url) for _ in range(count)]
+        start = time.perf_counter()
+        results = await asyncio.gather(*(s.login('test', 'test') for s in sessions))
+        elapsed = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0]
+        for session in sessions:
+            await session.close()
+        return sum(map(bool, results)), elapsed, memory
+
+    return asyncio.run(run())
+
+
+def _thread_sessions(base_url, count):
+    """每个会话一个线程同时登录，返回 (成功数, 耗时, 登录后保持连接时的内存)"""
+    from auth import Authenticator
+
+    sessions = [Authenticator(base_url=base_url, transport='http.client', query_cache=None)
+                for _ in range(count)]
+    results = [None] * count
+
+    def login(index):
+        results[index] = sessions[index].login('test', 'test')
+
+    threads = [threading.Thread(target=login, args=(i,)) for i in range(count)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    for session in sessions:
+        session.close()
+    return sum(map(bool, results)), elapsed, memory
+
+
+def bench_async(args):
+    """异步会话(单个事件循环)与同步会话(每会话一个线程)的登录耗时和内存对比
+
+    内存为 tracemalloc 统计的Python对象，不包括线程栈。
+    """
+    # 模拟门户在子进程中运行，内存统计只包含客户端
+    server = subprocess.Popen([sys.executable, str(Path(__file__).with_name('mock_portal.py')),
+                               '--latency', str(args.latency)],
+                              stdout=subprocess.PIPE, text=True)
+    try:
+        base_url = server.stdout.readline().strip()
+        # 先导入两种实现，内存统计不包含模块本身
+        import async_auth, auth
+        print(f"{'模式':<10}{'会话数':>8}{'成功率':>8}{'耗时(s)':>10}"
+              f"{'峰值KB/会话':>14}{'保持KB/会话':>14}{'线程数':>8}")
+        for count in args.sessions:
+            for name, runner in (('asyncio', _async_sessions), ('线程', _thread_sessions)):
+                tracemalloc.start()
+                ok, elapsed, memory = runner(base_url, count)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                threads = 1 if runner is _async_sessions else count + 1
+                print(f"{name:<10}{count:>8}{ok / count:>8.0%}{elapsed:>10.2f}"
+                      f"{peak / count / 1024:>14.1f}{memory / count / 1024:>14.1f}{threads:>8}")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def bench_cookies(args):
+    """模拟程序重启后登录：不保存会话与加密保存会话Cookie的请求数和耗时"""
+    from cryptography.fernet import Fernet
+    from auth import Authenticator, QueryStringCache, SessionCookieJar
+
+    tmp = Path(tempfile.mkdtemp())
+    cipher = Fernet(Fernet.generate_key())
+    # 门户只接受访问过认证页面的会话登录
+    portal = MockPortal(latency=args.latency, require_session=True)
+    print(f"{'模式':<14}{'成功率':>8}{'请求数/次':>10}{'认证页面/次':>12}{'平均耗时(ms)':>14}")
+    with portal:
+        for name, persist in (('不保存会话', False), ('保存会话', True)):
+            for path in tmp.iterdir():
+                path.unlink()
+            query_cache = QueryStringCache(cache_file=tmp / 'query_cache.json')
+            ok = 0
+            elapsed = 0.0
+            for round_index in range(args.rounds + 1):
+                if round_index == 1:
+                    # 第一次启动需要获取认证参数，不计入统计
+                    portal.reset()
+                portal.online_users.clear()
+                jar = SessionCookieJar(cipher, tmp / 'cookies.bin') if persist else None
+                # 每轮新建认证器，相当于重新启动程序
+                auth = Authenticator(base_url=portal.base_url, transport='http.client',
+                                     query_cache=query_cache, cookie_jar=jar)
+                start = time.perf_counter()
+                result = auth.login('test', 'test')
+                if round_index:
+                    elapsed += time.perf_counter() - start
+                    ok += bool(result)
+                auth.close()
+            stats = portal.stats
+            print(f"{name:<14}{ok / args.rounds:>8.0%}{stats['requests'] / args.rounds:>10.2f}"
+                  f"{stats['endpoints']['/eportal/index.jsp'] / args.rounds:>12.2f}"
+                  f"{elapsed / args.rounds * 1000:>14.1f}")
+
+
+def bench_heartbeat(args):
+    """门户空闲下线时，有无心跳学习的下线次数、离线时间和请求数(时间按比例缩短)"""
+    from auth import Authenticator
+    from heartbeat import Heartbeat
+    from network_watchdog import NetworkWatchdog
+
+    class Credentials:
+        def credentials_for_network(self, portal):
+            return 'test', 'test'
+
+    # 门户不返回心跳间隔，只能靠观察下线学习
+    portal = MockPortal(idle_timeout=args.idle_timeout, keepalive_interval=None)
+    print(f"门户空闲下线: {args.idle_timeout}s  运行: {args.duration}s")
+    print(f"{'模式':<14}{'空闲下线':>10}{'重新登录耗时(s)':>16}{'请求数':>8}{'最终间隔(s)':>12}"
+          f"{'学到的超时(s)':>14}")
+    modes = (('无心跳', False, 0.0), ('心跳学习', True, 0.0),
+             (f'心跳学习+{args.error_rate:.0%}错误', True, args.error_rate))
+    with portal:
+        for name, use_heartbeat, error_rate in modes:
+            portal.reset()
+            # 门户随机返回错误，状态查询失败不应被当作空闲下线
+            portal.error_rate = error_rate
+            auth = Authenticator(base_url=portal.base_url, transport='http.client',
+                                 query_cache=None, status_ttl=0)
+            heartbeat = Heartbeat(min_interval=0.05, max_interval=args.max_interval) \
+                if use_heartbeat else None
+            watchdog = NetworkWatchdog(auth, Credentials(), healthy_interval=0.2,
+                                       max_healthy_interval=args.max_interval,
+                                       retry_interval=0.05, max_retry_interval=0.5,
+                                       heartbeat=heartbeat)
+            offline = [0.0, None]
+
+            def on_state(state):
+                now = time.monotonic()
+                if state == NetworkWatchdog.STATE_ONLINE and offline[1] is not None:
+                    offline[0] += now - offline[1]
+                    offline[1] = None
+                elif state != NetworkWatchdog.STATE_ONLINE and offline[1] is None:
+                    offline[1] = now
+
+            watchdog.add_listener(on_state)
+            watchdog.start(initial_delay=0)
+            time.sleep(args.duration)
+            watchdog.stop()
+            auth.close()
+            interval = watchdog._healthy_delay()
+            learned = heartbeat.idle_timeout if heartbeat and heartbeat.idle_timeout else None
+            print(f"{name:<14}{portal.stats['idle_logouts']:>10}{offline[0]:>16.2f}"
+                  f"{portal.stats['requests']:>8}{interval:>12.2f}"
+                  f"{learned if learned is not None else float('nan'):>14.2f}")
+
+
+# 子进程中不停修改配置，用于测试被强制结束时配置文件是否损坏
+_CONFIG_WRITER_SNIPPET = """
+import json, sys
+from config import Config
+config = Config(config_dir=sys.argv[1], save_delay=0)
+enabled = True
+if sys.argv[2] == 'plain':
+    # 旧的写法：直接覆盖写入
+    while True:
+        enabled = not enabled
+        config.config['auto_login'] = enabled
+        with open(config.config_file, 'w') as f:
+            json.dump(config.config, f, separators=(',', ':'))
+while True:
+    enabled = not enabled
+    config.set_auto_login(enabled)
+"""
+
+
+def _crash_consistency(mode, kills):
+    """反复强制结束写配置的子进程，返回配置文件损坏的次数"""
+    import json
+    import random
+
+    corrupted = 0
+    config_dir = Path(tempfile.mkdtemp())
+    for _ in range(kills):
+        child = subprocess.Popen([sys.executable, '-c', _CONFIG_WRITER_SNIPPET,
+                                  str(config_dir), mode], cwd=Path(__file__).parent)
+        time.sleep(random.uniform(0.3, 0.6))
+        child.kill()
+        child.wait()
+        try:
+            with open(config_dir / 'config.json') as f:
+                json.load(f)
+        except (OSError, ValueError):
+            corrupted += 1
+    return corrupted
+
+
+def bench_config(args):
+    """配置每次切换的写文件次数、调用耗时，以及写入中途被强制结束后的文件完整性
+
+    原子替换写入后配置文件仍有损坏时返回非零退出码；直接覆盖写入只作对比。
+    """
+    from config import Config
+
+    print(f"{'保存方式':<16}{'切换次数':>8}{'写文件次数':>10}{'每次切换耗时(ms)':>18}")
+    for name, delay in (('立即写入', 0), (f'合并写入 {args.delay}s', args.delay)):
+        config = Config(config_dir=tempfile.mkdtemp(), save_delay=delay)
+        config.flush()
+        config.write_count = 0
+        elapsed = 0.0
+        for i in range(args.toggles):
+            start = time.perf_counter()
+            config.set_auto_login(i % 2 == 0)
+            elapsed += time.perf_counter() - start
+            # 模拟连续点击开关
+            time.sleep(args.interval)
+        config.flush()
+        print(f"{name:<16}{args.toggles:>8}{config.write_count:>10}"
+              f"{elapsed / args.toggles * 1000:>18.3f}")
+
+    if args.kills:
+        print(f"强制结束写配置的进程 {args.kills} 次后配置文件损坏次数:")
+        corrupted = {}
+        for name, mode in (('直接覆盖写入', 'plain'), ('临时文件+原子替换', 'atomic')):
+            corrupted[mode] = _crash_consistency(mode, args.kills)
+            print(f"  {name:<16}{corrupted[mode]:>4}")
+        if corrupted['atomic']:
+            print(f"失败: 原子替换写入后配置文件损坏 {corrupted['atomic']} 次", file=sys.stderr)
+            return 1
+    return 0
+
+
+def bench_gui(args):
+    """界面线程在慢门户上登录时是否保持响应：统计登录期间 10ms 定时器的触发情况
+
+    使用 offscreen 平台，不需要显示器。后台登录时定时器最长间隔超过 --max-stall
+    毫秒则返回非零退出码；同时给出在界面线程中直接登录作为对比。
+    """
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt6.QtCore import QTimer
+    from PyQt6.QtWidgets import QApplication
+    from auth import Authenticator
+    from auth_worker import run_auth_task
+
+    app = QApplication.instance() or QApplication([])
+    portal = MockPortal(latency=args.latency)
+
+    def measure(start_login):
+        """返回 (登录结果, 耗时, 定时器触发次数, 最长间隔)"""
+        ticks = []
+        timer = QTimer()
+        timer.setInterval(10)
+        timer.timeout.connect(lambda: ticks.append(time.perf_counter()))
+        outcome = {}
+
+        def finished(result):
+            outcome['result'] = result
+            outcome['elapsed'] = time.perf_counter() - start
+            app.quit()
+
+        # 超时保护，避免登录卡住时基准测试不退出
+        guard = QTimer()
+        guard.setSingleShot(True)
+        guard.timeout.connect(app.quit)
+        guard.start(int(args.timeout * 1000))
+        timer.start()
+        start = time.perf_counter()
+        ticks.append(start)
+        QTimer.singleShot(0, lambda: start_login(finished))
+        app.exec()
+        guard.stop()
+        timer.stop()
+        ticks.append(start + outcome.get('elapsed', args.timeout))
+        gaps = [b - a for a, b in zip(ticks, ticks[1:])]
+        return outcome.get('result'), outcome.get('elapsed'), len(ticks) - 2, max(gaps)
+
+    def background(finished):
+        run_auth_task(lambda progress, cancel_event: auth.login('test', 'test', progress,
+                                                                cancel_event), finished)
+
+    def blocking(finished):
+        finished(auth.login('test', 'test'))
+
+    print(f"门户每个请求处理耗时: {args.latency * 1000:.0f}ms  定时器间隔: 10ms")
+    print(f"{'登录方式':<14}{'结果':>10}{'耗时(ms)':>10}{'定时器触发':>10}{'最长间隔(ms)':>14}")
+    stalls = {}
+    with portal:
+        for name, start_login in (('后台线程', background), ('界面线程(对比)', blocking)):
+            portal.reset()
+            auth = Authenticator(base_url=portal.base_url, transport='http.client', query_cache=None)
+            result, elapsed, ticks, stall = measure(start_login)
+            auth.close()
+            stalls[name] = stall
+            reason = result.reason if result is not None else '超时'
+            print(f"{name:<14}{reason:>10}{(elapsed or 0) * 1000:>10.0f}{ticks:>10}"
+                  f"{stall * 1000:>14.1f}")
+    if stalls['后台线程'] * 1000 > args.max_stall:
+        print(f"失败: 后台登录期间界面事件循环停顿 {stalls['后台线程'] * 1000:.0f}ms", file=sys.stderr)
+        return 1
+    print("通过: 后台登录期间界面事件循环保持运行")
+    return 0
+
+
+def bench_keygen(args):
+    """首次启动(没有密钥文件)时创建配置的耗时：同步等待密钥与后台派生对比"""
+    from config import Config
+
+    def launch(config_dir, wait):
+        start = time.perf_counter()
+        config = Config(config_dir=config_dir)
+        if wait:
+            # 旧的行为：创建配置时同步派生密钥
+            config.cipher
+        config.get_auto_login()
+        usable = time.perf_counter() - start
+        config.cipher
+        ready = time.perf_counter() - start
+        config.flush()
+        return usable, ready
+
+    print(f"{'启动方式':<20}{'配置可用(ms)':>14}{'密钥就绪(ms)':>14}")
+    rows = (('首次启动 同步派生', True, True), ('首次启动 后台派生', False, True),
+            ('再次启动', False, False))
+    for name, wait, cold in rows:
+        usable, ready = [], []
+        for _ in range(args.rounds):
+            config_dir = tempfile.mkdtemp()
+            if not cold:
+                launch(config_dir, True)
+            u, r = launch(config_dir, wait)
+            usable.append(u)
+            ready.append(r)
+        print(f"{name:<20}{statistics.median(usable) * 1000:>14.1f}"
+              f"{statistics.median(ready) * 1000:>14.1f}")
+
+
+def bench_credentials(args):
+    """重复读取凭据(如断线重连循环)的耗时：每次解密与内存缓存对比"""
+    from config import Config
+
+    config = Config(config_dir=tempfile.mkdtemp())
+    config.save_credentials('test', 'test')
+    config.flush()
+    print(f"{'读取方式':<16}{'次数':>8}{'命中':>8}{'未命中':>8}{'每次耗时(us)':>14}")
+    for name, ttl in (('每次解密', 0), (f'缓存 {args.ttl}s', args.ttl)):
+        config.credential_cache.clear()
+        config.credential_cache.ttl = ttl
+        config.credential_cache.hits = config.credential_cache.misses = 0
+        start = time.perf_counter()
+        for _ in range(args.number):
+            config.get_credentials()
+        elapsed = time.perf_counter() - start
+        stats = config.credential_cache.stats()
+        print(f"{name:<16}{args.number:>8}{stats['hits']:>8}{stats['misses']:>8}"
+              f"{elapsed / args.number * 1e6:>14.1f}")
+
+
+def bench_profiles(args):
+    """按网络选择账号：索引查询与解密全部账号后逐个比较的耗时对比"""
+    from cryptography.fernet import Fernet
+    from profile_store import ProfileStore
+
+    store = ProfileStore(Fernet(Fernet.generate_key()),
+                         Path(tempfile.mkdtemp()) / 'profiles.db')
+    for i in range(args.profiles):
+        store.save(f'p{i}', f'user{i}', 'password', portal=f'http://10.{i // 256}.{i % 256}.1',
+                   gateway_ip=f'172.16.{i // 256}.{i % 256}')
+    targets = [f'172.16.{i // 256}.{i % 256}' for i in range(0, args.profiles, 7)]
+
+    def scan(gateway_ip):
+        for profile in store.profiles():
+            full = store.get(profile.name)
+            if full.gateway_ip == gateway_ip:
+                return full
+
+    print(f"{'查找方式':<16}{'账号数':>8}{'每次查找(ms)':>14}")
+    for name, find in (('索引查询', lambda ip: store.match(None, ip, None)), ('逐个解密比较', scan)):
+        start = time.perf_counter()
+        for ip in targets[:args.rounds]:
+            assert find(ip).gateway_ip == ip
+        elapsed = (time.perf_counter() - start) / min(len(targets), args.rounds)
+        print(f"{name:<16}{args.profiles:>8}{elapsed * 1000:>14.3f}")
+    store.close()
+
+
+def bench_reload(args):
+    """配置热加载：文件未变化时的检查开销，以及外部修改后被发现的延迟"""
+    import json
+    from config import Config
+    from config_watcher import ConfigWatcher
+
+    config = Config(config_dir=tempfile.mkdtemp(), save_delay=0)
+
+    def external_write(values):
+        with open(config.config_file, 'r') as f:
+            data = json.load(f)
+        data.update(values)
+        tmp_file = config.config_file.with_suffix('.json.ext')
+        with open(tmp_file, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_file, config.config_file)
+
+    start = time.perf_counter()
+    for _ in range(args.number):
+        config.reload()
+    unchanged = (time.perf_counter() - start) / args.number
+    print(f"文件未变化时每次检查耗时: {unchanged * 1e6:.1f}us")
+
+    print(f"{'监视方式':<12}{'外部修改':>8}{'自身写入':>8}{'通知次数':>8}{'发现延迟中位数(ms)':>20}")
+    for mode in ('inotify', 'polling'):
+        events = []
+        changed = threading.Event()
+
+        def listener(key, old, new):
+            events.append(key)
+            changed.set()
+
+        config.add_listener(listener)
+        watcher = ConfigWatcher(config.config_file, config.reload, args.interval,
+                                use_inotify=mode == 'inotify')
+        watcher.start()
+        time.sleep(0.2)
+        delays = []
+        for i in range(args.rounds):
+            changed.clear()
+            start = time.perf_counter()
+            # 只有 auto_login 的值变化，只应通知这一项
+            external_write({'auto_login': i % 2 == 0, 'startup_window': 0})
+            if changed.wait(args.interval * 3 + 1):
+                delays.append(time.perf_counter() - start)
+            # 本程序自己的写入不触发通知
+            config.set_watchdog(i % 2 == 0)
+            time.sleep(args.interval * 2 if mode == 'polling' else 0.05)
+        watcher.stop()
+        config.remove_listener(listener)
+        print(f"{mode:<12}{args.rounds:>8}{args.rounds:>8}{len(events):>8}"
+              f"{statistics.median(delays) * 1000 if delays else float('nan'):>20.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="认证性能测试(使用本地模拟门户)")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('keepalive', help="长连接与短连接对比")
+    p.add_argument('--rounds', type=int, default=20)
+    p.add_argument('--connect-latency', type=float, default=0.02,
+                   help="模拟每个新连接的建立耗时(秒)")
+    p.set_defaults(func=bench_keepalive)
+
+    p = sub.add_parser('latency', help="登录/状态查询延迟分布")
+    p.add_argument('--rounds', type=int, default=200)
+    p.add_argument('--transport', default='requests')
+    p.add_argument('--latency', type=float, default=0.002, help="模拟每个请求的处理耗时(秒)")
+    p.add_argument('--jitter', type=float, default=0.003, help="额外随机延迟上限(秒)")
+    p.add_argument('--error-rate', type=float, default=0.0, help="门户随机返回错误的比例")
+    p.add_argument('--redirect', choices=MockPortal.REDIRECT_SHAPES, default='redirect')
+    p.add_argument('--discovery', choices=['fast', 'legacy'], default='fast', help="认证参数获取方式")
+    p.add_argument('--query-cache', action='store_true', help="开启认证参数缓存")
+    p.add_argument('--cache-file', default=str(Path(tempfile.gettempdir()) / 'bench_query_cache.json'))
+    p.set_defaults(func=bench_latency)
+
+    p = sub.add_parser('transport', help="传输后端对比")
+    p.add_argument('--rounds', type=int, default=5)
+    p.set_defaults(func=bench_transport)
+
+    p = sub.add_parser('tracing', help="追踪开销")
+    p.add_argument('--number', type=int, default=100000)
+    p.set_defaults(func=bench_tracing)
+
+    p = sub.add_parser('herd', help="大量客户端同时登录(惊群)模拟")
+    p.add_argument('--clients', type=int, default=60)
+    p.add_argument('--capacity', type=int, default=8, help="门户同时处理的请求数上限")
+    p.add_argument('--latency', type=float, default=0.05, help="模拟每个请求的处理耗时(秒)")
+    p.add_argument('--overload-latency', type=float, default=0.5,
+                   help="超出并发上限的请求返回错误前的等待(秒)")
+    p.add_argument('--window', type=float, default=3.0, help="错峰窗口(秒)")
+    p.add_argument('--jitter', type=float, default=0.5, help="额外随机等待上限(秒)")
+    p.set_defaults(func=bench_herd)
+
+    p = sub.add_parser('portals', help="多门户竞速与故障切换")
+    p.add_argument('--rounds', type=int, default=20)
+    p.add_argument('--latency', type=float, default=0.002, help="正常门户每个请求的处理耗时(秒)")
+    p.add_argument('--stagger', type=float, default=0.05, help="依次启动下一个门户的间隔(秒)")
+    p.set_defaults(func=bench_portals)
+
+    p = sub.add_parser('batch', help="批量认证并发性能")
+    p.add_argument('--accounts', type=int, default=100)
+    p.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    p.add_argument('--rate', type=float, help="每秒最多开始的登录数，默认不限")
+    p.add_argument('--latency', type=float, default=0.01, help="模拟每个请求的处理耗时(秒)")
+    p.add_argument('--capacity', type=int, help="门户同时处理的请求数上限")
+    p.set_defaults(func=bench_batch)
+
+    p = sub.add_parser('async', help="异步会话与线程会话的扩展性对比")
+    p.add_argument('--sessions', type=int, nargs='+', default=[10, 100, 500])
+    p.add_argument('--latency', type=float, default=0.01, help="模拟每个请求的处理耗时(秒)")
+    p.set_defaults(func=bench_async)
+
+    p = sub.add_parser('cookies', help="重启后复用保存的会话Cookie")
+    p.add_argument('--rounds', type=int, default=20)
+    p.add_argument('--latency', type=float, default=0.005, help="模拟每个请求的处理耗时(秒)")
+    p.set_defaults(func=bench_cookies)
+
+    p = sub.add_parser('heartbeat', help="空闲下线与心跳间隔学习")
+    p.add_argument('--idle-timeout', type=float, default=1.0, help="门户空闲下线时间(秒)")
+    p.add_argument('--max-interval', type=float, default=3.0, help="最长检查间隔(秒)")
+    p.add_argument('--duration', type=float, default=20.0, help="运行时间(秒)")
+    p.add_argument('--error-rate', type=float, default=0.1, help="第三组门户随机返回错误的比例")
+    p.set_defaults(func=bench_heartbeat)
+
+    p = sub.add_parser('config', help="配置保存的写入次数和崩溃一致性")
+    p.add_argument('--toggles', type=int, default=50)
+    p.add_argument('--interval', type=float, default=0.02, help="两次切换的间隔(秒)")
+    p.add_argument('--delay', type=float, default=0.5, help="合并写入的延迟(秒)")
+    p.add_argument('--kills', type=int, default=20, help="崩溃一致性测试中强制结束子进程的次数")
+    p.set_defaults(func=bench_config)
+
+    p = sub.add_parser('gui', help="慢门户上登录时界面事件循环是否保持响应(offscreen)")
+    p.add_argument('--latency', type=float, default=0.3, help="模拟每个请求的处理耗时(秒)")
+    p.add_argument('--max-stall', type=float, default=100, help="允许的最长定时器间隔(毫秒)")
+    p.add_argument('--timeout', type=float, default=15, help="单次登录的最长等待(秒)")
+    p.set_defaults(func=bench_gui)
+
+    p = sub.add_parser('keygen', help="首次启动时密钥派生对启动耗时的影响")
+    p.add_argument('--rounds', type=int, default=5)
+    p.set_defaults(func=bench_keygen)
+
+    p = sub.add_parser('credentials', help="重复读取凭据的解密开销")
+    p.add_argument('--number', type=int, default=1000)
+    p.add_argument('--ttl', type=float, default=300)
+    p.set_defaults(func=bench_credentials)
+
+    p = sub.add_parser('profiles', help="多账号存储按网络选择账号的耗时")
+    p.add_argument('--profiles', type=int, default=500)
+    p.add_argument('--rounds', type=int, default=20)
+    p.set_defaults(func=bench_profiles)
+
+    p = sub.add_parser('reload', help="配置文件热加载的开销与延迟")
+    p.add_argument('--number', type=int, default=10000)
+    p.add_argument('--rounds', type=int, default=10)
+    p.add_argument('--interval', type=float, default=0.5, help="定时检查的间隔(秒)")
+    p.set_defaults(func=bench_reload)
+
+    p = sub.add_parser('importtime', help="命令行与图形界面入口的启动开销对比")
+    p.add_argument('modules', nargs='*', default=['cli', 'main'])
+    p.set_defaults(func=bench_importtime)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,255 @@
+import argparse
+import getpass
+import logging
+import signal
+import sys
+import threading
+from auth import Authenticator, AuthResult
+from config import Config
+from logger import logger
+from network_watchdog import NetworkWatchdog
+from heartbeat import Heartbeat
+from tracing import tracer
+from startup_stagger import staggered_login
+
+# 退出码
+EXIT_OK = 0
+EXIT_FAILED = 1
+# 2 由 argparse 用于参数错误
+EXIT_NO_CREDENTIALS = 3
+EXIT_UNREACHABLE = 4
+
+NO_CREDENTIALS_MESSAGE = "没有可用的账号密码，请使用 --username/--password、--profile 或先保存账号"
+
+
+class _StaticCredentials:
+    """命令行传入的凭据，供断线监测使用"""
+
+    def __init__(self, username, password):
+        self.username = username
+        self.password = password
+
+    def credentials_for_network(self, portal):
+        return self.username, self.password
+
+
+def _resolve_credentials(args, config, portal):
+    """命令行参数优先，其次是 --profile 指定的账号，否则按当前网络选择保存的账号
+
+    只指定 --username 时，仅在它与保存的账号相同时使用保存的密码，否则提示输入。
+    """
+    if args.username and args.password:
+        return args.username, args.password
+    if args.profile:
+        profile = config.profile_store().get(args.profile)
+        if profile is None:
+            return '', ''
+        username, password = profile.username, profile.password
+    else:
+        username, password = config.credentials_for_network(portal)
+    if args.username and args.username != username:
+        # 保存的密码属于另一个账号；不是交互终端时无法输入，按没有密码处理
+        password = getpass.getpass(f"{args.username} 的密码: ") if sys.stdin.isatty() else ''
+        username = args.username
+    return username, password
+
+
+def cmd_login(args):
+    """登录一次"""
+    config = Config()
+    auth = Authenticator(portals=args.portal or config.get_portals(), transport=args.transport,
+                         cookie_jar=config.create_cookie_jar())
+    username, password = _resolve_credentials(args, config, auth.base_url)
+    if not username or not password:
+        print(NO_CREDENTIALS_MESSAGE, file=sys.stderr)
+        return EXIT_NO_CREDENTIALS
+
+    window, jitter = config.get_startup_stagger()
+    if args.stagger is not None:
+        window = args.stagger
+    if args.jitter is not None:
+        jitter = args.jitter
+    if window or jitter:
+        result = staggered_login(auth, username, password, config.get_device_id(), window, jitter)
+    else:
+        result = auth.login(username, password)
+    if result:
+        print("认证成功")
+        return EXIT_OK
+    if result.reason == AuthResult.UNREACHABLE:
+        print("无法连接认证服务器", file=sys.stderr)
+        return EXIT_UNREACHABLE
+    print(f"认证失败: {result.reason}", file=sys.stderr)
+    return EXIT_FAILED
+
+
+def cmd_status(args):
+    """查询认证状态"""
+    auth = Authenticator(portals=args.portal or Config().get_portals(), query_cache=None,
+                         transport=args.transport)
+    if not auth.is_reachable():
+        print("无法连接认证服务器", file=sys.stderr)
+        return EXIT_UNREACHABLE
+    info = auth.online_info()
+    if info:
+        print("网络已认证")
+        for label, value in info.details():
+            print(f"  {label}: {value}")
+        return EXIT_OK
+    print("网络未认证")
+    return EXIT_FAILED
+
+
+def cmd_watch(args):
+    """持续监测，掉线后自动重新登录，直到收到退出信号"""
+    config = Config()
+    auth = Authenticator(portals=args.portal or config.get_portals(), transport=args.transport,
+                         cookie_jar=config.create_cookie_jar())
+    username, password = _resolve_credentials(args, config, auth.base_url)
+    if not username or not password:
+        print(NO_CREDENTIALS_MESSAGE, file=sys.stderr)
+        return EXIT_NO_CREDENTIALS
+
+    heartbeat = Heartbeat(idle_timeout=config.get_idle_timeout(),
+                          on_learned=config.set_idle_timeout)
+    if args.username or args.profile:
+        credentials = _StaticCredentials(username, password)
+    else:
+        # 使用保存的账号时，每次重新登录都按当前网络选择
+        credentials = config
+    watchdog = NetworkWatchdog(auth, credentials, heartbeat=heartbeat)
+    watchdog.add_listener(lambda state: print(f"状态: {state}", flush=True))
+
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+
+    watchdog.start(initial_delay=0)
+    # 主线程只等待退出信号
+    while not stop.wait(1):
+        pass
+    watchdog.stop()
+    return EXIT_OK
+
+
+def cmd_batch(args):
+    """并发认证账号列表中的所有账号"""
+    from batch_auth import BatchAuthenticator, load_accounts, format_results
+
+    try:
+        accounts = load_accounts(args.file)
+    except (OSError, ValueError) as e:
+        print(f"读取账号列表失败: {str(e)}", file=sys.stderr)
+        return EXIT_FAILED
+    batch = BatchAuthenticator(concurrency=args.concurrency, rate=args.rate,
+                               portals=args.portal or Config().get_portals(),
+                               transport=args.transport)
+    results = batch.run(accounts)
+    print(format_results(results))
+    return EXIT_OK if all(results) else EXIT_FAILED
+
+
+def cmd_profile(args):
+    """管理多账号存储"""
+    config = Config()
+    store = config.profile_store()
+    if args.action == 'list':
+        for profile in store.profiles():
+            network = ', '.join(value for value in (profile.gateway_mac, profile.gateway_ip,
+                                                     profile.portal) if value)
+            print(f"{profile.name:<16}{profile.username:<20}{network}")
+        return EXIT_OK
+    if args.action == 'remove':
+        if not store.remove(args.name):
+            print(f"账号 {args.name} 不存在", file=sys.stderr)
+            return EXIT_FAILED
+        return EXIT_OK
+
+    if not args.username:
+        print("请使用 --username 指定账号", file=sys.stderr)
+        return EXIT_FAILED
+    password = args.password or getpass.getpass("密码: ")
+    gateway_ip, gateway_mac = args.gateway_ip, args.gateway_mac
+    if args.this_network:
+        from profile_store import detect_gateway
+        detected_ip, detected_mac = detect_gateway()
+        gateway_ip = gateway_ip or detected_ip
+        gateway_mac = gateway_mac or detected_mac
+    store.save(args.name, args.username, password, portal=args.match_portal,
+               gateway_ip=gateway_ip, gateway_mac=gateway_mac)
+    print(f"已保存账号 {args.name}")
+    return EXIT_OK
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="校园网认证(命令行版，不加载图形界面)")
+    parser.add_argument('--portal', action='append',
+                        help="认证门户地址，可重复指定多个，竞速使用最先响应的门户；"
+                             "默认使用配置中的门户或 http://10.10.10.52")
+    parser.add_argument('--transport', choices=['http.client', 'requests'], default='http.client',
+                        help="HTTP传输后端，默认使用标准库 http.client 以减少启动开销")
+    parser.add_argument('--trace', action='store_true', help="记录各阶段耗时并在结束时输出汇总")
+    parser.add_argument('-v', '--verbose', action='store_true', help="同时在控制台输出日志")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    for name, func, help_text in (
+        ('login', cmd_login, "登录一次"),
+        ('watch', cmd_watch, "持续监测并自动重新登录"),
+    ):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument('-u', '--username')
+        p.add_argument('-p', '--password')
+        p.add_argument('--profile', help="使用多账号存储中指定名称的账号")
+        p.set_defaults(func=func)
+        if name == 'login':
+            p.add_argument('--stagger', type=float, metavar='SECONDS',
+                           help="开机错峰窗口，按本机MAC在窗口内固定延迟后再登录")
+            p.add_argument('--jitter', type=float, metavar='SECONDS', help="额外随机等待上限")
+
+    p = sub.add_parser('batch', help="并发认证多个账号")
+    p.add_argument('file', help="账号列表(CSV或JSON)，列: username,password[,portal,wlanuserip,mac]")
+    p.add_argument('--concurrency', type=int, default=8, help="同时登录的账号数")
+    p.add_argument('--rate', type=float, help="每个门户每秒最多开始的登录数，默认不限")
+    p.set_defaults(func=cmd_batch)
+
+    p = sub.add_parser('profile', help="管理多账号存储")
+    p.add_argument('action', choices=['list', 'add', 'remove'])
+    p.add_argument('name', nargs='?', default='default', help="账号名称")
+    p.add_argument('-u', '--username')
+    p.add_argument('-p', '--password', help="不指定时提示输入")
+    p.add_argument('--match-portal', metavar='URL', help="在该门户下使用此账号")
+    p.add_argument('--gateway-ip', help="在默认网关为该IP的网络中使用此账号")
+    p.add_argument('--gateway-mac', help="在默认网关为该MAC的网络中使用此账号")
+    p.add_argument('--this-network', action='store_true', help="记录当前网络的默认网关")
+    p.set_defaults(func=cmd_profile)
+
+    p = sub.add_parser('status', help="查询认证状态")
+    p.set_defaults(func=cmd_status)
+
+    args = parser.parse_args(argv)
+    if args.verbose:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s', datefmt='%H:%M:%S'))
+        logger.logger.addHandler(handler)
+
+    if args.trace:
+        tracer.enable()
+
+    logger.info(f"命令行启动: {args.command}")
+    try:
+        return args.func(args)
+    finally:
+        if args.trace:
+            _print_trace_summary()
+
+
+def _print_trace_summary():
+    """输出各阶段耗时汇总"""
+    print(f"{'阶段':<12}{'次数':>6}{'平均(ms)':>10}{'最大(ms)':>10}", file=sys.stderr)
+    for name, item in tracer.summary().items():
+        print(f"{name:<12}{item['count']:>6}{item['avg_ms']:>10.1f}{item['max_ms']:>10.1f}",
+              file=sys.stderr)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
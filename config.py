@@ -1,55 +1,218 @@
+import atexit
+import copy
 import json
 import os
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
 from pathlib import Path
 from cryptography.fernet import Fernet
 import base64
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from logger import logger
+from atomic_file import write_atomic
+from credential_cache import CredentialCache
 
 class Config:
-    def __init__(self):
+    # 密钥派生参数，修改后下次启动时自动迁移(重新派生密钥并重新加密密码)
+    KDF_NAME = 'pbkdf2-sha256'
+    KDF_ITERATIONS = 100000
+    KDF_LENGTH = 32
+    
+    # 外部修改配置文件后重新加载时各项允许的类型，类型不符的项被忽略
+    VALUE_TYPES = {
+        'remember_password': bool,
+        'username': str,
+        'encrypted_password': str,
+        'auto_login': bool,
+        'auto_startup': bool,
+        'is_startup_launch': bool,
+        'watchdog': bool,
+        'startup_window': (int, float),
+        'startup_jitter': (int, float),
+        'portals': list,
+        'persist_cookies': bool,
+        'idle_timeout': (int, float, type(None)),
+        'credential_ttl': (int, float),
+        'profiles_migrated': bool,
+    }
+    
+    def __init__(self, config_dir=None, save_delay=0.5):
         # 配置文件路径
-        self.config_dir = Path.home() / '.campus_network'
+        self.config_dir = Path(config_dir) if config_dir else Path.home() / '.campus_network'
         self.config_file = self.config_dir / 'config.json'
         self.key_file = self.config_dir / 'key.key'
         
+        # 修改后延迟 save_delay 秒在后台写入，期间的多次修改合并为一次；0 表示立即写入
+        self.save_delay = save_delay
+        self.write_count = 0
+        self._pending = None
+        self._timer = None
+        self._batch_depth = 0
+        self._save_lock = threading.RLock()
+        # 配置文件的 (修改时间, 大小)，与之相同说明文件未被外部修改
+        self._file_signature = None
+        # 最近一次读取或写入文件时的配置内容，与之不同的项是尚未写入的本地修改
+        self._disk_config = {}
+        # 配置项变化的监听器 [(配置项或 None, 回调)] 和文件监视器
+        self._listeners = []
+        self._watcher = None
+        # 退出时写入未保存的修改
+        atexit.register(self.flush)
+        
         # 创建配置目录
         if not self.config_dir.exists():
             self.config_dir.mkdir(parents=True)
             
-        # 初始化加密key
-        self._init_encryption_key()
-        
         # 加载配置
         self.config = self._load_config()
         
+        # 初始化加密key：需要派生密钥时在后台线程进行，通过 cipher 属性等待结果
+        self._cipher_future = Future()
+        self._init_encryption_key()
+        
+        # 解密后的凭据缓存，重复登录时不再解密
+        self.credential_cache = CredentialCache(self.config.get('credential_ttl', 300))
+        # 按网络选择的多账号存储中的账号，同样只在有效期内保留解密后的密码
+        self.profile_cache = CredentialCache(self.config.get('credential_ttl', 300))
+        # 多账号存储，首次使用时打开
+        self._profile_store = None
+        self._profile_lock = threading.Lock()
+        
+    @property
+    def cipher(self):
+        """加密器，密钥尚在后台派生时等待其完成"""
+        return self._cipher_future.result()
+        
+    @property
+    def cipher_future(self):
+        """加密器的 Future，可在不阻塞的情况下检查或等待密钥就绪"""
+        return self._cipher_future
+        
+    def cipher_ready(self):
+        """密钥是否已就绪"""
+        return self._cipher_future.done()
+        
+    def _kdf_params(self):
+        """当前的密钥派生参数"""
+        return {
+            'kdf': self.KDF_NAME,
+            'iterations': self.KDF_ITERATIONS,
+            'length': self.KDF_LENGTH,
+            'salt': base64.b64encode(self._get_device_salt()).decode(),
+        }
+        
     def _init_encryption_key(self):
         """初始化或加载加密密钥"""
-        if not self.key_file.exists():
-            # 使用设备特定信息作为盐值
-            salt = self._get_device_salt()
-            
-            # 使用PBKDF2生成密钥
+        stored = self._read_key_file()
+        params = self._kdf_params()
+        if stored is None:
+            # 首次运行：后台派生密钥
+            self._start_key_derivation(params, None)
+            return
+        key, stored_params, legacy = stored
+        if stored_params != params:
+            # 派生参数已调整，后台用新参数重新派生
+            logger.info("密钥派生参数已变化，后台迁移密钥")
+            self._start_key_derivation(params, Fernet(key))
+            return
+        if legacy:
+            # 旧格式的密钥文件补上派生参数
+            self._write_key_file(key, params)
+        self._cipher_future.set_result(Fernet(key))
+        
+    def _read_key_file(self):
+        """读取密钥文件，返回 (密钥, 派生参数, 是否旧格式)，不存在时返回 None
+
+        旧版本的密钥文件只有密钥本身，其派生参数为 100000 次 PBKDF2-SHA256。
+        """
+        try:
+            with open(self.key_file, 'rb') as f:
+                data = f.read().strip()
+        except FileNotFoundError:
+            return None
+        if data.startswith(b'{'):
+            stored = json.loads(data)
+            key = stored.pop('key').encode()
+            return key, stored, False
+        return data, {
+            'kdf': 'pbkdf2-sha256',
+            'iterations': 100000,
+            'length': 32,
+            'salt': base64.b64encode(self._get_device_salt()).decode(),
+        }, True
+        
+    def _write_key_file(self, key, params):
+        """保存密钥和派生参数"""
+        write_atomic(self.key_file, json.dumps(dict(params, key=key.decode())).encode())
+        
+    def _start_key_derivation(self, params, old_cipher):
+        thread = threading.Thread(target=self._derive_key, args=(params, old_cipher),
+                                  name='KeyDerivation', daemon=True)
+        thread.start()
+        
+    def _derive_key(self, params, old_cipher):
+        """派生并保存密钥；迁移时用新密钥重新加密已保存的密码"""
+        try:
+            # 使用设备信息生成密钥，设备特定信息的哈希作为盐值
             kdf = PBKDF2HMAC(
                 algorithm=hashes.SHA256(),
-                length=32,
-                salt=salt,
-                iterations=100000,
+                length=params['length'],
+                salt=base64.b64decode(params['salt']),
+                iterations=params['iterations'],
             )
-            
-            # 使用设备信息生成密钥
             key = base64.urlsafe_b64encode(kdf.derive(self._get_device_info().encode()))
+            cipher = Fernet(key)
             
-            # 保存密钥
-            with open(self.key_file, 'wb') as f:
-                f.write(key)
-        else:
-            # 加载已有密钥
-            with open(self.key_file, 'rb') as f:
-                key = f.read()
+            if old_cipher is not None:
+                # 先迁移所有用旧密钥加密的数据，再写入新密钥文件
+                self._reencrypt_profiles(old_cipher, cipher)
+                self._reencrypt_cookies(old_cipher, cipher)
+                self._reencrypt_password(old_cipher, cipher)
                 
-        self.cipher = Fernet(key)
+            self._write_key_file(key, params)
+            self._cipher_future.set_result(cipher)
+        except Exception as e:
+            logger.error(f"生成加密密钥失败: {str(e)}")
+            self._cipher_future.set_exception(e)
+            
+    def _reencrypt_profiles(self, old_cipher, new_cipher):
+        if self._profile_store is None and not (self.config_dir / 'profiles.db').exists():
+            return
+        count = self.profile_store().reencrypt(old_cipher, new_cipher)
+        logger.info(f"已使用新密钥重新加密 {count} 个账号")
+        
+    def _reencrypt_cookies(self, old_cipher, new_cipher):
+        """重新加密保存的会话Cookie，无法解密时丢弃"""
+        cookie_file = self.config_dir / 'cookies.bin'
+        try:
+            with open(cookie_file, 'rb') as f:
+                data = old_cipher.decrypt(f.read())
+            write_atomic(cookie_file, new_cipher.encrypt(data))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"迁移密钥时重新加密会话失败，已丢弃: {str(e)}")
+            try:
+                cookie_file.unlink()
+            except OSError:
+                pass
+        
+    def _reencrypt_password(self, old_cipher, new_cipher):
+        encrypted_pwd = self.config.get('encrypted_password', '')
+        if not encrypted_pwd:
+            return
+        try:
+            password = old_cipher.decrypt(encrypted_pwd.encode())
+        except Exception as e:
+            logger.error(f"迁移密钥时解密密码失败: {str(e)}")
+            return
+        self.config['encrypted_password'] = new_cipher.encrypt(password).decode()
+        # 先于新密钥文件写入，避免密钥已更换而密码仍是旧密钥加密的
+        self._save_config(self.config)
+        self.flush()
+        logger.info("已使用新密钥重新加密密码")
         
     def _get_device_info(self):
         """获取设备特定信息"""
@@ -76,33 +239,196 @@ class Config:
                 'encrypted_password': '',
                 'auto_login': True,  # 默认开启自动登录
                 'auto_startup': False,  # 默认关闭开机自启
-                'is_startup_launch': False  # 标记是否是开机启动
+                'is_startup_launch': False,  # 标记是否是开机启动
+                'watchdog': True,  # 默认开启断线自动重连
+                'startup_window': 0,  # 开机登录错峰窗口(秒)，0 表示不错峰
+                'startup_jitter': 0,  # 开机登录额外随机等待上限(秒)
+                'portals': [],  # 认证门户地址列表，为空时使用默认门户
+                'persist_cookies': True,  # 加密保存门户会话Cookie，重启后复用
+                'idle_timeout': None,  # 学到的门户空闲下线时间(秒)
+                'credential_ttl': 300  # 解密后的密码在内存中缓存的时间(秒)，0 表示不缓存
             }
             self._save_config(default_config)
             return default_config
             
         try:
+            signature = self._stat_config_file()
             with open(self.config_file, 'r') as f:
-                return json.load(f)
-        except:
+                config = json.load(f)
+            self._file_signature = signature
+            self._disk_config = copy.deepcopy(config)
+            return config
+        except Exception as e:
+            # 保留损坏的文件便于排查，使用默认配置
+            logger.error(f"配置文件损坏，使用默认配置: {str(e)}")
+            try:
+                os.replace(self.config_file, self.config_file.with_suffix('.json.corrupt'))
+            except OSError:
+                pass
             return {
                 'remember_password': False,
                 'username': '',
                 'encrypted_password': '',
                 'auto_login': True,  # 默认开启自动登录
                 'auto_startup': False,  # 默认关闭开机自启
-                'is_startup_launch': False  # 标记是否是开机启动
+                'is_startup_launch': False,  # 标记是否是开机启动
+                'watchdog': True,  # 默认开启断线自动重连
+                'startup_window': 0,  # 开机登录错峰窗口(秒)，0 表示不错峰
+                'startup_jitter': 0,  # 开机登录额外随机等待上限(秒)
+                'portals': [],  # 认证门户地址列表，为空时使用默认门户
+                'persist_cookies': True,  # 加密保存门户会话Cookie，重启后复用
+                'idle_timeout': None,  # 学到的门户空闲下线时间(秒)
+                'credential_ttl': 300  # 解密后的密码在内存中缓存的时间(秒)，0 表示不缓存
             }
             
     def _save_config(self, config):
-        """保存配置到文件"""
-        import json
-        # 使用更紧凑的JSON格式
-        with open(self.config_file, 'w') as f:
-            json.dump(config, f, separators=(',', ':'))
+        """保存配置：短时间内的多次修改合并后在后台写入"""
+        with self._save_lock:
+            self._pending = config
+            if self._batch_depth:
+                return
+        self._schedule_flush()
+        
+    def _schedule_flush(self):
+        if self.save_delay <= 0:
+            self.flush()
+            return
+        with self._save_lock:
+            # 每次修改重新计时
+            if self._timer:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.save_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+            
+    @contextmanager
+    def batch(self):
+        """批量修改多个配置项，结束时只保存一次"""
+        with self._save_lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._save_lock:
+                self._batch_depth -= 1
+                changed = not self._batch_depth and self._pending is not None
+            if changed:
+                self._schedule_flush()
+                
+    def flush(self):
+        """立即写入未保存的修改"""
+        with self._save_lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            config, self._pending = self._pending, None
+            if config is not None:
+                self._write_atomic(dict(config))
+                
+    def _write_atomic(self, config):
+        """先写临时文件并刷到磁盘，再原子替换，写入中途崩溃不会损坏原文件"""
+        try:
+            # 使用更紧凑的JSON格式
+            write_atomic(self.config_file, json.dumps(config, separators=(',', ':')).encode())
+            self.write_count += 1
+            self._file_signature = self._stat_config_file()
+            self._disk_config = copy.deepcopy(config)
+        except Exception as e:
+            logger.error(f"保存配置失败: {str(e)}")
+            
+    def _stat_config_file(self):
+        try:
+            stat = os.stat(self.config_file)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+        
+    def add_listener(self, callback, key=None):
+        """注册配置项变化的回调 callback(配置项, 旧值, 新值)
+
+        key 为 None 时所有配置项变化都会通知。回调在监视线程中调用。
+        """
+        self._listeners.append((key, callback))
+        
+    def remove_listener(self, callback):
+        self._listeners = [item for item in self._listeners if item[1] != callback]
+        
+    def watch(self, interval=2.0):
+        """开始监视配置文件，被外部修改时自动重新加载"""
+        if self._watcher is None:
+            from config_watcher import ConfigWatcher
+            self._watcher = ConfigWatcher(self.config_file, self.reload, interval)
+            self._watcher.start()
+        
+    def stop_watching(self):
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+        
+    def reload(self):
+        """文件被外部修改时重新加载，只通知值发生变化的配置项，返回变化的配置项列表
+
+        文件没有变化(包括本程序自己写入的)时不读取文件；内容无效时保留当前配置。
+        尚未写入的本地修改优先，不被文件中的旧值覆盖，随后的保存会把两边的修改合并写入。
+        """
+        with self._save_lock:
+            signature = self._stat_config_file()
+            if signature is None or signature == self._file_signature:
+                return []
+            try:
+                with open(self.config_file, 'r') as f:
+                    loaded = json.load(f)
+                if not isinstance(loaded, dict):
+                    raise ValueError("配置文件内容不是对象")
+            except Exception as e:
+                # 可能是外部程序正在写入，保留当前配置，等待下一次修改
+                logger.error(f"重新加载配置失败: {str(e)}")
+                return []
+            self._file_signature = signature
+            base, self._disk_config = self._disk_config, copy.deepcopy(loaded)
+            
+            changes = []
+            for key in loaded.keys() | self.config.keys():
+                old, new = self.config.get(key), loaded.get(key)
+                if old == new:
+                    continue
+                if old != base.get(key) or (key in self.config) != (key in base):
+                    # 本地修改尚未写入
+                    continue
+                expected = self.VALUE_TYPES.get(key)
+                if key in loaded and expected and not isinstance(new, expected):
+                    logger.error(f"配置项 {key} 的值无效，已忽略: {new!r}")
+                    continue
+                if key in loaded:
+                    self.config[key] = new
+                else:
+                    del self.config[key]
+                changes.append((key, old, new))
+        if not changes:
+            return []
+            
+        keys = [key for key, _, _ in changes]
+        logger.info(f"配置文件已被修改，重新加载: {', '.join(sorted(keys))}")
+        if {'username', 'encrypted_password', 'remember_password'} & set(keys):
+            self.credential_cache.clear()
+            self.profile_cache.clear()
+        if 'credential_ttl' in keys:
+            self.credential_cache.ttl = self.profile_cache.ttl = self.config.get('credential_ttl', 300)
+        for key, old, new in changes:
+            for listen_key, callback in list(self._listeners):
+                if listen_key is None or listen_key == key:
+                    try:
+                        callback(key, old, new)
+                    except Exception as e:
+                        logger.error(f"配置项 {key} 的变化回调出错: {str(e)}")
+        return keys
             
     def get_credentials(self):
-        """获取保存的凭据"""
+        """获取保存的凭据，有效期内使用内存中的缓存"""
+        return self.credential_cache.get(self._read_credentials)
+        
+    def _read_credentials(self):
+        """从配置读取并解密凭据，返回 (用户名, 密码, 是否记住密码, 能否缓存)"""
         username = self.config.get('username', '')
         encrypted_pwd = self.config.get('encrypted_password', '')
         remember = self.config.get('remember_password', False)
@@ -112,17 +438,23 @@ class Config:
         password = ''
         if encrypted_pwd:
             try:
-                password = self.cipher.decrypt(encrypted_pwd.encode()).decode()
+                cipher = self.cipher
+                # 等待密钥期间可能发生了密钥迁移，重新读取加密后的密码
+                encrypted_pwd = self.config.get('encrypted_password', '')
+                password = cipher.decrypt(encrypted_pwd.encode()).decode()
                 logger.info("密码解密成功")
             except Exception as e:
                 logger.error(f"密码解密失败: {str(e)}")
-                password = ''
+                # 解密失败的结果不缓存，下次读取时重试
+                return username, '', remember, False
                 
-        return username, password, remember
+        return username, password, remember, True
         
     def save_credentials(self, username, password, remember=True):
         """保存凭据"""
         logger.info(f"保存凭据 - 用户名: {username}, 记住密码: {remember}")
+        self.credential_cache.clear()
+        self.profile_cache.clear()
         
         if remember:
             try:
@@ -149,15 +481,19 @@ class Config:
             logger.info("清除保存的凭据")
             
         self._save_config(self.config)
+        self._sync_default_profile()
         
     def clear_credentials(self):
         """清除保存的凭据"""
+        self.credential_cache.clear()
+        self.profile_cache.clear()
         self.config.update({
             'username': '',
             'encrypted_password': '',
             'remember_password': False
         })
         self._save_config(self.config)
+        self._sync_default_profile()
         logger.info("凭据已清除")
         
     def get_auto_login(self):
@@ -185,4 +521,122 @@ class Config:
         
     def is_startup_launch(self):
         """检查是否是开机启动"""
-        return self.config.get('is_startup_launch', False)
\ No newline at end of file
+        return self.config.get('is_startup_launch', False)
+        
+    def get_device_id(self):
+        """获取设备标识"""
+        return self._get_device_info()
+        
+    def get_startup_stagger(self):
+        """获取开机登录错峰设置 (窗口秒数, 随机抖动秒数)"""
+        return self.config.get('startup_window', 0), self.config.get('startup_jitter', 0)
+        
+    def get_portals(self):
+        """获取认证门户地址列表，未配置时返回 None"""
+        return self.config.get('portals') or None
+        
+    def set_portals(self, portals):
+        """设置认证门户地址列表"""
+        self.config['portals'] = list(portals)
+        self._save_config(self.config)
+        
+    def get_persist_cookies(self):
+        """获取是否保存门户会话Cookie"""
+        return self.config.get('persist_cookies', True)
+        
+    def create_cookie_jar(self):
+        """按设置创建会话Cookie存储，关闭时返回 None"""
+        if not self.get_persist_cookies():
+            return None
+        from auth import SessionCookieJar
+        return SessionCookieJar(self._cipher_future, self.config_dir / 'cookies.bin')
+        
+    def profile_store(self):
+        """多账号存储，首次打开时导入 config.json 中保存的账号"""
+        with self._profile_lock:
+            if self._profile_store is None:
+                from profile_store import ProfileStore
+                self._profile_store = ProfileStore(self._cipher_future,
+                                                   self.config_dir / 'profiles.db')
+                self._migrate_profiles(self._profile_store)
+            return self._profile_store
+        
+    def _migrate_profiles(self, store):
+        """把 config.json 中的账号导入为名为 default 的账号，只进行一次"""
+        if self.config.get('profiles_migrated'):
+            return
+        username = self.config.get('username', '')
+        encrypted_pwd = self.config.get('encrypted_password', '')
+        if username and encrypted_pwd and not len(store):
+            portals = self.get_portals()
+            store.import_token('default', username, encrypted_pwd,
+                               portal=portals[0] if portals else None)
+            logger.info(f"已导入保存的账号 {username}")
+        self.config['profiles_migrated'] = True
+        self._save_config(self.config)
+        
+    def _sync_default_profile(self):
+        """保存的凭据变化后，同步更新导入的 default 账号；凭据被清除时删除该账号"""
+        if self._profile_store is None and not (self.config_dir / 'profiles.db').exists():
+            return
+        store = self.profile_store()
+        default = next((p for p in store.profiles() if p.name == 'default'), None)
+        if default is None:
+            return
+        username = self.config.get('username', '')
+        encrypted_pwd = self.config.get('encrypted_password', '')
+        if username and encrypted_pwd:
+            store.import_token('default', username, encrypted_pwd, portal=default.portal)
+        else:
+            store.remove('default')
+            logger.info("已删除导入的账号 default")
+        
+    def credentials_for_network(self, portal):
+        """选择适用于当前网络的账号，返回 (用户名, 密码)
+
+        按默认网关和门户地址匹配多账号存储中的账号，没有匹配时使用保存的凭据。
+        同一网络的匹配结果在有效期内缓存，不再重复查询和解密。
+        会执行系统命令获取网关，不要在界面线程中调用。
+        """
+        store = self.profile_store()
+        if len(store):
+            from profile_store import detect_gateway
+            gateway_ip, gateway_mac = detect_gateway()
+            # 第三项表示是否匹配到账号
+            username, password, matched = self.profile_cache.get(
+                lambda: self._match_profile(store, portal, gateway_ip, gateway_mac),
+                key=(portal, gateway_ip, gateway_mac))
+            if matched:
+                return username, password
+        username, password, remember = self.get_credentials()
+        return (username, password) if remember else (username, '')
+        
+    def _match_profile(self, store, portal, gateway_ip, gateway_mac):
+        """查询并解密适用的账号，返回 (用户名, 密码, 是否匹配, 能否缓存)"""
+        profile = store.match(portal, gateway_ip, gateway_mac)
+        if profile is None:
+            return '', '', False, True
+        if not profile.password:
+            # 解密失败，下次重试
+            return '', '', False, False
+        logger.info(f"使用账号 {profile.name} ({profile.username})")
+        store.touch(profile.name)
+        return profile.username, profile.password, True, True
+        
+    def get_idle_timeout(self):
+        """获取学到的门户空闲下线时间(秒)，未学到时返回 None"""
+        return self.config.get('idle_timeout')
+        
+    def set_idle_timeout(self, seconds):
+        """保存学到的门户空闲下线时间"""
+        self.config['idle_timeout'] = round(seconds, 1)
+        self._save_config(self.config)
+        
+    def get_watchdog(self):
+        """获取断线自动重连设置"""
+        return self.config.get('watchdog', True)
+        
+    def set_watchdog(self, enabled):
+        """设置断线自动重连"""
+        self.config['watchdog'] = enabled
+        self._save_config(self.config)
\ No newline at end of file
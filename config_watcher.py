@@ -0,0 +1,126 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+from logger import logger
+
+# inotify 事件：文件写完关闭、被移入(原子替换)、被创建
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class _Inotify:
+    """通过 ctypes 使用 Linux inotify 监视一个目录"""
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, "inotify_add_watch 失败")
+
+    def read(self, timeout):
+        """等待最多 timeout 秒，返回发生变化的文件名集合"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        names = set()
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            _, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            names.add(os.fsdecode(data[offset:offset + length].rstrip(b'\0')))
+            offset += length
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ConfigWatcher:
+    """监视配置文件被外部修改，发现变化时调用 on_change()
+
+    Linux 上使用 inotify 监视配置目录，文件被写入或原子替换时立即通知；
+    其他平台、inotify 不可用或 use_inotify=False 时每 interval 秒比较一次文件的修改时间和大小。
+    """
+
+    def __init__(self, path, on_change, interval=2.0, use_inotify=True):
+        self.path = os.fspath(path)
+        self.on_change = on_change
+        self.interval = interval
+        self.use_inotify = use_inotify
+        self.mode = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='ConfigWatcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def _notify(self):
+        try:
+            self.on_change()
+        except Exception as e:
+            logger.error(f"重新加载配置出错: {str(e)}")
+
+    def _run(self):
+        inotify = None
+        if self.use_inotify and sys.platform.startswith('linux'):
+            try:
+                inotify = _Inotify(os.path.dirname(self.path) or '.')
+            except (OSError, AttributeError) as e:
+                logger.info(f"inotify 不可用，改为定时检查配置文件: {str(e)}")
+        if inotify is not None:
+            self.mode = 'inotify'
+            self._run_inotify(inotify)
+        else:
+            self.mode = 'polling'
+            self._run_polling()
+
+    def _run_inotify(self, inotify):
+        name = os.path.basename(self.path)
+        try:
+            while not self._stop.is_set():
+                # 定时醒来检查是否需要停止
+                if name in inotify.read(min(self.interval, 1.0)):
+                    self._notify()
+        finally:
+            inotify.close()
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _run_polling(self):
+        signature = self._signature()
+        while not self._stop.wait(self.interval):
+            current = self._signature()
+            if current != signature:
+                signature = current
+                self._notify()
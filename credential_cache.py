@@ -0,0 +1,78 @@
+import threading
+import time
+
+
+class CredentialCache:
+    """解密后的凭据在内存中的缓存
+
+    第一次读取时解密并缓存，ttl 秒内再次读取直接返回，不再解密和写日志。
+    密码保存在可修改的 bytearray 中，到期时由定时器、或 clear() 时先清零再丢弃；
+    返回给调用方的字符串副本不受此限制。ttl 为 0 时不缓存。
+    读取时可传入 key(如当前网络)，与缓存时的 key 不同时重新读取。
+    """
+
+    def __init__(self, ttl=300, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._username = None
+        self._password = None
+        self._remember = False
+        self._key = None
+        self._expires = 0
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def get(self, loader, key=None):
+        """返回 (用户名, 密码, 是否记住密码)，没有有效缓存时调用 loader() 读取
+
+        loader() 返回 (用户名, 密码, 是否记住密码, 能否缓存)，解密失败等结果不缓存。
+        """
+        with self._lock:
+            if (self._password is not None and self._key == key
+                    and self.clock() < self._expires):
+                self.hits += 1
+                return self._username, self._password.decode(), self._remember
+            self._wipe()
+            self.misses += 1
+            username, password, remember, cacheable = loader()
+            if self.ttl > 0 and cacheable:
+                self._username = username
+                self._password = bytearray(password.encode())
+                self._remember = remember
+                self._key = key
+                self._expires = self.clock() + self.ttl
+                # 到期时即使没有再次读取也清零
+                self._timer = threading.Timer(self.ttl, self._expire)
+                self._timer.daemon = True
+                self._timer.start()
+            return username, password, remember
+
+    def clear(self):
+        """清零并丢弃缓存的密码"""
+        with self._lock:
+            self._wipe()
+
+    def _expire(self):
+        with self._lock:
+            # 缓存已被清除或替换时，旧的定时器不再生效
+            if threading.current_thread() is self._timer:
+                self._wipe()
+
+    def _wipe(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._password is not None:
+            for i in range(len(self._password)):
+                self._password[i] = 0
+        self._username = None
+        self._password = None
+        self._remember = False
+        self._key = None
+        self._expires = 0
+
+    def stats(self):
+        """命中与未命中次数"""
+        return {'hits': self.hits, 'misses': self.misses}
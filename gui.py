@@ -1,4 +1,4 @@
-from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtCore import Qt, QTimer, QObject, pyqtSignal
 from PyQt6.QtWidgets import (QVBoxLayout, QFrame, QApplication, QLineEdit,
                            QSystemTrayIcon, QMenu)
 from PyQt6.QtGui import QColor, QPalette
@@ -7,21 +7,45 @@ from qfluentwidgets import (FluentWindow, LineEdit, MessageBox, InfoBar,
                           SubtitleLabel, SmoothScrollArea, SwitchButton,
                           PushButton)
 from qfluentwidgets import FluentIcon as FIF
-from auth import Authenticator
+from auth import Authenticator, AuthResult
+from auth_worker import run_auth_task
 from config import Config
 from style import apply_style
 from icon import create_heart_icon
 from startup import add_to_startup, remove_from_startup, check_startup
+from network_watchdog import NetworkWatchdog
+from heartbeat import Heartbeat
+from startup_stagger import staggered_login
+from logger import logger
 import weakref
 import time
 import sys
 
+class WatchdogBridge(QObject):
+    """把监测线程的状态回调转发到界面线程"""
+    state_changed = pyqtSignal(str)
+
+
+class ConfigBridge(QObject):
+    """把配置文件被外部修改的通知转发到界面线程"""
+    changed = pyqtSignal(str, object)
+
+
+class CipherBridge(QObject):
+    """后台派生的密钥就绪后通知界面线程"""
+    ready = pyqtSignal()
+
+
 class MainWindow(FluentWindow):
-    def __init__(self):
+    def __init__(self, start_time=None):
         super().__init__()
         # 检查启动参数
         self.is_startup = '--startup' in sys.argv
         self.is_minimized = '--minimized' in sys.argv
+        # 进程启动时刻(time.perf_counter)，用于统计托盘图标显示耗时
+        self.start_time = start_time
+        # 一次启动只自动登录一次
+        self._auto_login_started = False
         
         # 初始化基本组件
         self._init_basic_components()
@@ -31,22 +55,38 @@ class MainWindow(FluentWindow):
         
         # 根据启动方式决定显示状态
         if self.is_startup:
-            # 开机自启动时隐藏窗口，尝试自动登录
+            # 开机自启动时隐藏窗口
             self.hide()
-            self._try_auto_login()
         else:
             # 用户手动启动时显示窗口
             self.show()
+        
+        # 事件循环启动后再进行网络请求，保证窗口和托盘先显示
+        QTimer.singleShot(0, self._on_event_loop_started)
 
     def _init_basic_components(self):
         """初始化基本组件"""
         # 初始化认证器和配置
-        self.auth = Authenticator()
         self.config = Config()
+        # 密钥在后台派生时，就绪前界面不读取密码，就绪后再加载凭据和自动登录
+        self._cipher_bridge = CipherBridge()
+        self._cipher_waiting = set()
+        if not self.config.cipher_ready():
+            self._cipher_bridge.ready.connect(self._on_cipher_ready,
+                                              Qt.ConnectionType.QueuedConnection)
+            self.config.cipher_future.add_done_callback(
+                lambda _: self._cipher_bridge.ready.emit())
+        self.auth = Authenticator(portals=self.config.get_portals(),
+                                  cookie_jar=self.config.create_cookie_jar())
+        # 当前进行中的手动登录任务
+        self._login_task = None
         
         # 初始化系统托盘
         self._init_tray()
         
+        # 初始化断线监测
+        self._init_watchdog()
+        
         # 设置窗口基本属性
         self.setWindowTitle("校园网认证")
         self.resize(1000, 600)
@@ -59,20 +99,27 @@ class MainWindow(FluentWindow):
         self._load_saved_credentials()
         self._init_settings()
         
+        # 配置文件被外部(如部署脚本)修改时更新界面
+        self._config_bridge = ConfigBridge()
+        self._config_bridge.changed.connect(self._on_config_changed)
+        self.config.add_listener(lambda key, old, new: self._config_bridge.changed.emit(key, new))
+        self.config.watch()
+        
         # 设置导航栏宽度
         self.navigationInterface.setFixedWidth(220)
         
         # 应用样式
         apply_style(self)
-        
-        # 根据启动方式决定是否显示窗口
-        if self.is_startup:
-            self.hide()
+
+    def _on_event_loop_started(self):
+        """事件循环启动后执行：记录启动耗时并开始自动登录"""
+        if self.start_time is not None:
+            elapsed = (time.perf_counter() - self.start_time) * 1000
+            logger.info(f"托盘图标已显示，启动耗时: {elapsed:.0f}ms")
+        
+        # 开机启动时总是尝试，手动启动时按自动登录设置
+        if self.is_startup or self.config.get_auto_login():
             self._try_auto_login()
-        else:
-            self.show()
-            if self.config.get_auto_login():
-                self._try_auto_login()
 
     def _init_ui(self):
         # 创建主界面
@@ -139,7 +186,15 @@ class MainWindow(FluentWindow):
         layout.addWidget(self.remember_checkbox)
         layout.addWidget(self.login_btn)
         
+    def _on_cipher_ready(self):
+        waiting, self._cipher_waiting = self._cipher_waiting, set()
+        for callback in waiting:
+            callback()
+        
     def _load_saved_credentials(self):
+        if not self.config.cipher_ready():
+            self._cipher_waiting.add(self._load_saved_credentials)
+            return
         # 加载保存的凭据
         username, password, remember = self.config.get_credentials()
         if username:
@@ -149,47 +204,94 @@ class MainWindow(FluentWindow):
         self.remember_checkbox.setChecked(remember)
         
     def _on_login(self):
+        # 登录进行中再次点击按钮则取消
+        if self._login_task is not None:
+            self._login_task.cancel()
+            return
+        
         username = self.username_edit.text()
         password = self.password_edit.text()
+        remember = self.remember_checkbox.isChecked()
+        
+        # 显示加载状态，按钮保持可用以便取消
+        self.login_btn.setText("登录中...(点击取消)")
+        
+        def task(progress, cancel_event):
+            # 在工作线程中执行，不能访问界面控件
+            progress(Authenticator.PHASE_STATUS)
+            if not self.auth.is_reachable():
+                return 'unreachable'
+            if self.auth.check_status():
+                return 'online'
+            if not username or not password:
+                return 'missing'
+            result = self.auth.login(username, password, progress, cancel_event)
+            return 'success' if result else result.reason
+        
+        self._login_task = run_auth_task(
+            task,
+            lambda result: self._on_login_finished(result, username, password, remember),
+            on_progress=self._on_login_progress,
+            on_cancelled=self._on_login_cancelled
+        )
         
-        # 禁用登录按钮，显示加载状态
-        self.login_btn.setEnabled(False)
-        self.login_btn.setText("登录中...")
-        QApplication.processEvents()  # 确保UI更新
+    def _on_login_progress(self, phase):
+        """显示登录进度"""
+        texts = {
+            Authenticator.PHASE_STATUS: "检查认证状态...",
+            Authenticator.PHASE_DISCOVER: "获取认证参数...",
+            Authenticator.PHASE_LOGIN: "发送登录请求...",
+        }
+        if self._login_task is not None:
+            self.login_btn.setText(f"{texts.get(phase, '登录中...')}(点击取消)")
+        
+    def _reset_login_button(self):
+        """恢复按钮状态"""
+        self._login_task = None
+        self.login_btn.setEnabled(True)
+        self.login_btn.setText("登录")
+        
+    def _on_login_cancelled(self):
+        self._reset_login_button()
+        InfoBar.warning(
+            title="提示",
+            content="已取消登录",
+            position=InfoBarPosition.TOP,
+            parent=self
+        )
+        
+    def _on_login_finished(self, result, username, password, remember):
+        self._reset_login_button()
         
         # 检查认证状态
-        if self.auth.check_status():
+        if result == 'online':
             InfoBar.success(
                 title="提示",
                 content="您已经认证，无需重复登录",
                 position=InfoBarPosition.TOP,
                 parent=self
             )
-            # 恢复按钮状态
-            self.login_btn.setEnabled(True)
-            self.login_btn.setText("登录")
             return
         
-        if not username or not password:
+        if result == 'missing':
             MessageBox("提示", "请输入用户名和密码", self).exec()
-            # 恢复按钮状态
-            self.login_btn.setEnabled(True)
-            self.login_btn.setText("登录")
             return
-            
-        # 尝试认证
-        success = self.auth.login(username, password)
         
-        # 恢复按钮状态
-        self.login_btn.setEnabled(True)
-        self.login_btn.setText("登录")
+        if result == 'unreachable':
+            InfoBar.error(
+                title="错误",
+                content="无法连接认证服务器，请检查网络连接",
+                position=InfoBarPosition.TOP,
+                parent=self
+            )
+            return
         
-        if success:
+        if result == 'success':
             # 保存凭据
             self.config.save_credentials(
                 username,
                 password,
-                self.remember_checkbox.isChecked()
+                remember
             )
             
             InfoBar.success(
@@ -199,13 +301,20 @@ class MainWindow(FluentWindow):
                 parent=self
             )
             
-            # 如果是开机启动且登录成功，3秒后自动关闭
-            if self.is_startup:
+            # 如果是开机启动且登录成功，未开启断线监测时3秒后自动关闭
+            if self.is_startup and not self.watchdog.is_running():
                 QTimer.singleShot(3000, self.quit_app)
         else:
+            # 按失败原因提示
+            messages = {
+                AuthResult.CIRCUIT_OPEN: "认证服务器多次无响应，请稍后再试",
+                AuthResult.TIMEOUT: "认证服务器响应超时，请稍后再试",
+                AuthResult.CONNECTION: "连接认证服务器失败，请检查网络连接",
+                AuthResult.SERVER_ERROR: "认证服务器出错，请稍后再试",
+            }
             InfoBar.error(
                 title="错误",
-                content="认证失败,请检查用户名密码",
+                content=messages.get(result, "认证失败,请检查用户名密码"),
                 position=InfoBarPosition.TOP,
                 parent=self
             ) 
@@ -246,6 +355,7 @@ class MainWindow(FluentWindow):
         # 添加自动登录开关
         from qfluentwidgets import SwitchButton
         auto_login_switch = SwitchButton('开启', self)
+        self.auto_login_switch = auto_login_switch
         auto_login_switch.setChecked(self.config.get_auto_login())
         auto_login_switch.checkedChanged.connect(self._on_auto_login_changed)
         auto_login_switch.setText('开启' if auto_login_switch.isChecked() else '关闭')
@@ -259,6 +369,27 @@ class MainWindow(FluentWindow):
         # 添加分隔
         layout.addSpacing(5)
         
+        # 添加断线自动重连标题
+        watchdog_title = SubtitleLabel('断线自动重连', self)
+        watchdog_title.setFixedHeight(25)
+        layout.addWidget(watchdog_title)
+        
+        # 添加断线自动重连开关
+        watchdog_switch = SwitchButton('开启', self)
+        self.watchdog_switch = watchdog_switch
+        watchdog_switch.setChecked(self.config.get_watchdog())
+        watchdog_switch.checkedChanged.connect(self._on_watchdog_changed)
+        watchdog_switch.setText('开启' if watchdog_switch.isChecked() else '关闭')
+        watchdog_switch.checkedChanged.connect(
+            lambda checked: watchdog_switch.setText('开启' if checked else '关闭')
+        )
+        watchdog_switch.setFixedWidth(400)
+        watchdog_switch.setFixedHeight(35)
+        layout.addWidget(watchdog_switch)
+        
+        # 添加分隔
+        layout.addSpacing(5)
+        
         # 添加开机自启动标题
         startup_title = SubtitleLabel('开机自启动', self)
         startup_title.setFixedHeight(25)
@@ -486,22 +617,21 @@ class MainWindow(FluentWindow):
         
     def _check_auth_status(self):
         """检查认证状态"""
-        # 避免频繁创建消息
-        if not hasattr(self, '_last_check_time'):
-            self._last_check_time = 0
-        
-        current_time = time.time()
-        if current_time - self._last_check_time < 2:  # 限制检查频率
-            return
-        
-        self._last_check_time = current_time
+        # 短时间内重复点击由认证器的状态缓存合并为一次请求
+        run_auth_task(
+            lambda progress, cancel_event: self.auth.online_info(),
+            self._show_auth_status
+        )
         
-        if self.auth.check_status():
+    def _show_auth_status(self, info):
+        """在托盘显示认证状态和在线信息"""
+        if info:
+            lines = ['网络已认证'] + [f"{label}: {value}" for label, value in info.details()]
             self.tray_icon.showMessage(
                 '认证状态',
-                '网络已认证',
+                '\n'.join(lines),
                 QSystemTrayIcon.MessageIcon.Information,
-                2000
+                3000
             )
         else:
             self.tray_icon.showMessage(
@@ -517,6 +647,13 @@ class MainWindow(FluentWindow):
         from logger import logger
         logger.info("程序退出")
         
+        # 停止断线监测
+        self.watchdog.stop()
+        
+        # 写入尚未保存的配置
+        self.config.stop_watching()
+        self.config.flush()
+        
         # 清理系统托盘并退出
         self.tray_icon.hide()
         QApplication.quit()
@@ -527,36 +664,59 @@ class MainWindow(FluentWindow):
 
     def _try_auto_login(self):
         """尝试自动登录"""
+        if self._auto_login_started:
+            return
+        if not self.config.cipher_ready():
+            self._cipher_waiting.add(self._try_auto_login)
+            return
+        self._auto_login_started = True
+        
         username, password, remember = self.config.get_credentials()
         
-        if username and password and remember:
+        if (username and password and remember) or len(self.config.profile_store()):
             # 有保存的凭据
             if self.config.get_auto_login():
-                # 尝试认证
-                success = self.auth.login(username, password)
+                # 在后台线程按当前网络选择账号并尝试认证
+                window, jitter = self.config.get_startup_stagger()
+                device_id = self.config.get_device_id()
                 
-                if success:
-                    self.tray_icon.showMessage(
-                        '校园网认证',
-                        '自动登录成功',
-                        QSystemTrayIcon.MessageIcon.Information,
-                        2000
-                    )
-                    # 如果是开机启动且登录成功，3秒后自动关闭
+                def task(progress, cancel_event):
+                    username, password = self.config.credentials_for_network(self.auth.base_url)
+                    if not username or not password:
+                        logger.info("没有适用于当前网络的账号")
+                        return AuthResult(False, AuthResult.FAILED)
                     if self.is_startup:
-                        QTimer.singleShot(3000, self.quit_app)
-                else:
-                    self.tray_icon.showMessage(
-                        '校园网认证',
-                        '自动登录失败，请手动登录',
-                        QSystemTrayIcon.MessageIcon.Warning,
-                        2000
-                    )
-                    # 登录失败时显示主窗口
-                    self.show()
+                        # 开机启动时错峰登录，避免机房大量机器同时请求门户
+                        return staggered_login(self.auth, username, password, device_id,
+                                               window, jitter, cancel_event=cancel_event)
+                    return self.auth.login(username, password, progress, cancel_event)
+                run_auth_task(task, self._on_auto_login_finished)
         else:
             # 没有保存的凭据，显示主窗口
             self.show()
+            
+    def _on_auto_login_finished(self, result):
+        """处理自动登录结果"""
+        if result:
+            self.tray_icon.showMessage(
+                '校园网认证',
+                '自动登录成功',
+                QSystemTrayIcon.MessageIcon.Information,
+                2000
+            )
+            # 如果是开机启动且登录成功，未开启断线监测时3秒后自动关闭
+            if self.is_startup and not self.watchdog.is_running():
+                QTimer.singleShot(3000, self.quit_app)
+        else:
+            unreachable = result is not None and result.reason == AuthResult.UNREACHABLE
+            self.tray_icon.showMessage(
+                '校园网认证',
+                '无法连接认证服务器，自动登录失败' if unreachable else '自动登录失败，请手动登录',
+                QSystemTrayIcon.MessageIcon.Warning,
+                2000
+            )
+            # 登录失败时显示主窗口
+            self.show()
 
     def _on_auto_login_changed(self, checked):
         """处理自动登录开关状态改变"""
@@ -589,4 +749,89 @@ class MainWindow(FluentWindow):
                 content='设置开机自启动失败',
                 position=InfoBarPosition.TOP,
                 parent=self
-            )
\ No newline at end of file
+            )
+
+    def _init_watchdog(self):
+        """初始化断线监测"""
+        heartbeat = Heartbeat(idle_timeout=self.config.get_idle_timeout(),
+                              on_learned=self.config.set_idle_timeout)
+        self.watchdog = NetworkWatchdog(self.auth, self.config, heartbeat=heartbeat)
+        self._watchdog_state = None
+        self._watchdog_failure_shown = False
+        self._watchdog_bridge = WatchdogBridge()
+        self._watchdog_bridge.state_changed.connect(self._on_watchdog_state)
+        self.watchdog.add_listener(self._watchdog_bridge.state_changed.emit)
+        self.tray_icon.setToolTip('校园网认证')
+        if self.config.get_watchdog():
+            self.watchdog.start()
+
+    def _on_watchdog_state(self, state):
+        """在托盘上显示断线监测状态"""
+        tips = {
+            NetworkWatchdog.STATE_ONLINE: '网络已认证',
+            NetworkWatchdog.STATE_OFFLINE: '网络未认证',
+            NetworkWatchdog.STATE_RELOGIN: '正在重新登录',
+            NetworkWatchdog.STATE_UNREACHABLE: '无法连接认证服务器',
+            NetworkWatchdog.STATE_STOPPED: '断线监测已关闭',
+        }
+        previous = self._watchdog_state
+        self._watchdog_state = state
+        tooltip = f"校园网认证 - {tips.get(state, state)}"
+        if state == NetworkWatchdog.STATE_ONLINE:
+            # 使用监测刚刚缓存的在线信息，不再发送请求
+            info = self.auth.cached_online_info()
+            if info and info.user_ip:
+                tooltip += f"\n{info.user_id or ''} {info.user_ip}".rstrip()
+        self.tray_icon.setToolTip(tooltip)
+        
+        if state == NetworkWatchdog.STATE_ONLINE:
+            self._watchdog_failure_shown = False
+        
+        if state == NetworkWatchdog.STATE_ONLINE and previous == NetworkWatchdog.STATE_RELOGIN:
+            self.tray_icon.showMessage(
+                '校园网认证',
+                '检测到掉线，已自动重新登录',
+                QSystemTrayIcon.MessageIcon.Information,
+                2000
+            )
+        elif (state == NetworkWatchdog.STATE_OFFLINE and previous == NetworkWatchdog.STATE_RELOGIN
+                and not self._watchdog_failure_shown):
+            # 重试期间只提示一次
+            self._watchdog_failure_shown = True
+            self.tray_icon.showMessage(
+                '校园网认证',
+                '检测到掉线，自动重新登录失败',
+                QSystemTrayIcon.MessageIcon.Warning,
+                2000
+            )
+
+    def _on_config_changed(self, key, value):
+        """配置文件被外部修改后同步界面和断线监测，不再写回配置"""
+        switches = {'auto_login': self.auto_login_switch, 'watchdog': self.watchdog_switch}
+        if key in switches:
+            switch = switches[key]
+            switch.blockSignals(True)
+            switch.setChecked(bool(value))
+            switch.setText('开启' if value else '关闭')
+            switch.blockSignals(False)
+        if key == 'watchdog':
+            if value:
+                self.watchdog.start()
+            else:
+                self.watchdog.stop()
+        elif key in ('username', 'encrypted_password', 'remember_password'):
+            self._load_saved_credentials()
+
+    def _on_watchdog_changed(self, checked):
+        """处理断线自动重连开关状态改变"""
+        self.config.set_watchdog(checked)
+        if checked:
+            self.watchdog.start()
+        else:
+            self.watchdog.stop()
+        InfoBar.success(
+            title='成功',
+            content='已' + ('开启' if checked else '关闭') + '断线自动重连',
+            position=InfoBarPosition.TOP,
+            parent=self
+        )
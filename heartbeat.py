@@ -0,0 +1,82 @@
+import time
+from logger import logger
+
+
+class Heartbeat:
+    """学习门户的空闲下线时间，给出心跳间隔
+
+    门户会把一段时间没有活动的会话下线。每次发现会话被下线，
+    以距上次确认在线的时间作为空闲超时的上限；连续 confirmations 次观察都短于
+    当前的超时才下调(取其中最长的一次)，避免一次偶然的下线把间隔压得过短。
+    会话空闲超过学到的超时后仍在线时上调。心跳间隔取超时的 safety 倍；
+    门户返回了 keepaliveInterval 时直接使用该间隔。没有学到超时前使用 max_interval。
+    学到的超时通过 on_learned(秒) 回调保存。
+    """
+
+    def __init__(self, idle_timeout=None, safety=0.5, min_interval=10, max_interval=300,
+                 on_learned=None, clock=time.monotonic, confirmations=2):
+        self.idle_timeout = idle_timeout
+        self.safety = safety
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.on_learned = on_learned
+        self.clock = clock
+        self.confirmations = confirmations
+        # 门户给出的心跳间隔(秒)
+        self.keepalive_interval = None
+        self.last_online = None
+        # 尚未确认的下线观察(秒)
+        self._observed = []
+
+    @property
+    def interval(self):
+        """当前的心跳间隔(秒)"""
+        if self.keepalive_interval:
+            interval = self.keepalive_interval
+        elif self.idle_timeout:
+            interval = self.idle_timeout * self.safety
+        else:
+            return self.max_interval
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def observe_online(self, age=0, keepalive_interval=None):
+        """门户确认在线，age 为该结果距今的秒数，keepalive_interval 为门户返回的心跳间隔"""
+        now = self.clock() - age
+        if keepalive_interval:
+            try:
+                self.keepalive_interval = float(keepalive_interval)
+            except (TypeError, ValueError):
+                pass
+        if self.last_online is not None:
+            gap = now - self.last_online
+            # 空闲这么久仍在线，说明更短的下线观察不是空闲超时造成的
+            self._observed = [value for value in self._observed if value > gap]
+            if self.idle_timeout and gap > self.idle_timeout:
+                self._learn(gap, "会话空闲 {:.0f} 秒后仍在线")
+        self.last_online = now
+
+    def observe_logout(self):
+        """门户确认会话已被下线(而不是查询失败)"""
+        if self.last_online is None:
+            return
+        gap = self.clock() - self.last_online
+        self.last_online = None
+        if self.idle_timeout and gap >= self.idle_timeout:
+            self._observed.clear()
+            return
+        self._observed.append(gap)
+        if len(self._observed) < self.confirmations:
+            logger.info(f"会话空闲约 {gap:.0f} 秒后被下线，等待再次确认")
+            return
+        learned = max(self._observed)
+        self._observed.clear()
+        self._learn(learned, "会话空闲约 {:.0f} 秒后被下线")
+
+    def _learn(self, idle_timeout, reason):
+        self.idle_timeout = idle_timeout
+        logger.info(f"{reason.format(idle_timeout)}，心跳间隔调整为 {self.interval:.0f} 秒")
+        if self.on_learned:
+            try:
+                self.on_learned(idle_timeout)
+            except Exception as e:
+                logger.error(f"保存空闲超时出错: {str(e)}")
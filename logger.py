@@ -33,7 +33,7 @@ class Logger:
             
             # 设置格式
             formatter = logging.Formatter(
-                '%(asctime)s - %(message)s',
+                '%(asctime)s.%(msecs)03d - %(message)s',
                 datefmt='%m-%d %H:%M:%S'
             )
             self.file_handler.setFormatter(formatter)
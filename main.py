@@ -1,3 +1,7 @@
+import time
+# 尽早记录启动时刻，用于统计托盘图标显示耗时
+_start_time = time.perf_counter()
+
 from PyQt6.QtWidgets import QApplication, QMessageBox
 import sys
 from gui import MainWindow
@@ -32,7 +36,7 @@ def main():
     app = QApplication(sys.argv)
     app.setQuitOnLastWindowClosed(False)
     
-    window = MainWindow()
+    window = MainWindow(start_time=_start_time)
     logger.info("主窗口已创建")
     
     sys.exit(app.exec())
@@ -0,0 +1,313 @@
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+# 门户重定向时附带的认证参数
+DEFAULT_QUERY_STRING = (
+    "wlanuserip=10.20.30.40&wlanacname=ccit-ac&ssid=&nasip=10.10.10.1"
+    "&mac=00e04c680001&t=wireless-v2&url=http://www.msftconnecttest.com/redirect"
+)
+
+
+class _PortalHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # 响应头和响应体分开写出，关闭Nagle避免额外的延迟确认等待
+    disable_nagle_algorithm = True
+    _session = None
+    _new_session = False
+
+    def setup(self):
+        super().setup()
+        portal = self.server.portal
+        with portal.lock:
+            portal.stats['connections'] += 1
+        # 模拟建立连接(TCP握手等)的开销
+        if portal.connect_latency:
+            time.sleep(portal.connect_latency)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b'', headers=None):
+        portal = self.server.portal
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        if self._new_session:
+            self.send_header('Set-Cookie', f"JSESSIONID={self._session}; Path=/")
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        header_bytes = sum(len(line) for line in self._headers_buffer) + 2
+        self.end_headers()
+        self.wfile.write(body)
+        with portal.lock:
+            portal.stats['bytes_sent'] += header_bytes + len(body)
+
+    def _send_json(self, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self._send(200, body, {'Content-Type': 'application/json;charset=UTF-8'})
+
+    def _handle(self, method):
+        portal = self.server.portal
+        body = b''
+        if method == 'POST':
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length)
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        endpoint = query.get('method', [url.path])[0]
+        with portal.lock:
+            portal.stats['requests'] += 1
+            portal.stats['bytes_received'] += (
+                len(self.raw_requestline) + len(bytes(self.headers)) + len(body)
+            )
+            portal.stats['endpoints'][endpoint] += 1
+
+        # 按 JSESSIONID 区分客户端，每个客户端有各自的在线状态
+        cookie = self.headers.get('Cookie') or ''
+        session = next((part.split('=', 1)[1] for part in cookie.replace(' ', '').split(';')
+                        if part.startswith('JSESSIONID=')), None)
+        self._new_session = session is None
+        self._session = session or uuid.uuid4().hex
+        portal.touch(self._session)
+
+        if portal.slots is not None and not portal.slots.acquire(blocking=False):
+            # 超过并发处理能力：排队一段时间后返回错误
+            with portal.lock:
+                portal.stats['rejected'] += 1
+            if portal.overload_latency:
+                time.sleep(portal.overload_latency)
+            self._send(portal.error_status, b'Service Unavailable')
+            return
+        try:
+            self._process(url, query, body)
+        finally:
+            if portal.slots is not None:
+                portal.slots.release()
+
+    def _process(self, url, query, body):
+        portal = self.server.portal
+        delay = portal.latency + random.uniform(0, portal.latency_jitter)
+        if delay:
+            time.sleep(delay)
+        if portal.error_rate and random.random() < portal.error_rate:
+            self._send(portal.error_status, b'Service Unavailable')
+            return
+
+        if url.path == '/eportal/index.jsp':
+            with portal.lock:
+                portal.visited_sessions.add(self._session)
+            if not url.query:
+                self._send_auth_redirect()
+            else:
+                self._send(200, portal.index_body, {'Content-Type': 'text/html;charset=UTF-8'})
+        elif url.path == '/eportal/redirect':
+            # 多级跳转的中间一跳
+            self._send(302, headers={
+                'Location': f"/eportal/index.jsp?{portal.query_string}"
+            })
+        elif url.path == '/eportal/InterFace.do':
+            method_name = query.get('method', [''])[0]
+            if method_name == 'getOnlineUserInfo':
+                # 不带参数的查询返回的是发起请求的主机的状态
+                self._send_json(portal.online_user_info(portal.client_key(self._session)))
+            elif method_name == 'login':
+                form = parse_qs(body.decode('utf-8'))
+                query_string = unquote(form.get('queryString', [''])[0])
+                self._send_json(portal.do_login(
+                    form.get('userId', [''])[0],
+                    form.get('password', [''])[0],
+                    portal.client_key(self._session, query_string)
+                ))
+            else:
+                self._send(404)
+        else:
+            self._send(404)
+
+    def _send_auth_redirect(self):
+        """按配置的跳转方式把未带参数的请求引导到认证页面"""
+        portal = self.server.portal
+        target = f"/eportal/index.jsp?{portal.query_string}"
+        if portal.redirect_shape == 'chain':
+            self._send(302, headers={'Location': '/eportal/redirect'})
+        elif portal.redirect_shape == 'script':
+            # 锐捷网关拦截普通网页时返回的脚本跳转页面
+            host = self.headers.get('Host', '')
+            page = f"<script>top.self.location.href='http://{host}{target}'</script>"
+            self._send(200, page.encode('utf-8'), {'Content-Type': 'text/html;charset=UTF-8'})
+        else:
+            self._send(302, headers={'Location': target})
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+class _PortalServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # 大量客户端同时连接时不因监听队列过短被拒绝
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # 客户端超时断开属于正常情况，不打印堆栈
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class MockPortal:
+    """本地模拟的锐捷ePortal，在后台线程运行，用于没有真实门户时测量认证性能"""
+
+    # 支持的跳转方式：302直接跳转、多级302跳转、脚本跳转
+    REDIRECT_SHAPES = ('redirect', 'chain', 'script')
+
+    def __init__(self, accounts=None, latency=0.0, connect_latency=0.0,
+                 query_string=DEFAULT_QUERY_STRING, host='127.0.0.1', port=0,
+                 latency_jitter=0.0, error_rate=0.0, error_status=503,
+                 redirect_shape='redirect', max_concurrent=None, overload_latency=0.0,
+                 require_session=False, idle_timeout=None, track_by_ip=False,
+                 keepalive_interval=120):
+        # 允许登录的账号 {用户名: 密码}
+        self.accounts = accounts if accounts is not None else {'test': 'test'}
+        # 每个请求的处理延迟(秒)，再加上 [0, latency_jitter] 的随机延迟
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        # 每个新连接的建立延迟(秒)
+        self.connect_latency = connect_latency
+        # 按该比例随机返回 error_status 错误
+        self.error_rate = error_rate
+        self.error_status = error_status
+        if redirect_shape not in self.REDIRECT_SHAPES:
+            raise ValueError(f"未知的跳转方式: {redirect_shape}")
+        self.redirect_shape = redirect_shape
+        # 同时处理的请求数上限，超出的请求等待 overload_latency 秒后返回 error_status
+        self.max_concurrent = max_concurrent
+        self.overload_latency = overload_latency
+        self.slots = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+        # 为真时只接受访问过认证页面的会话登录，模拟门户校验JSESSIONID
+        self.require_session = require_session
+        self.visited_sessions = set()
+        # 会话超过 idle_timeout 秒没有请求时被下线，None 表示不下线
+        self.idle_timeout = idle_timeout
+        self.last_seen = {}
+        # 在线信息中返回的心跳间隔(秒)，None 表示不返回
+        self.keepalive_interval = keepalive_interval
+        self.query_string = query_string
+        # 为真时按终端IP(wlanuserip)区分在线状态，与真实门户一致：登录的终端由表单中
+        # queryString 的 wlanuserip 决定，状态查询返回发起请求的主机(即门户下发的 wlanuserip)
+        self.track_by_ip = track_by_ip
+        self.host_ip = parse_qs(query_string).get('wlanuserip', [''])[0]
+        self.index_body = b'<html><body>' + b'x' * 2048 + b'</body></html>'
+        self.lock = threading.Lock()
+        # 在线会话 {JSESSIONID 或终端IP: 用户名}
+        self.online_users = {}
+        self.stats = {}
+        self.reset()
+        self._server = _PortalServer((host, port), _PortalHandler)
+        self._server.portal = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reset(self):
+        """清空在线用户和统计数据"""
+        with self.lock:
+            self.online_users.clear()
+            self.stats = {
+                'connections': 0,
+                'requests': 0,
+                'bytes_sent': 0,
+                'bytes_received': 0,
+                # 因超出并发上限被拒绝的请求数
+                'rejected': 0,
+                # 因空闲超时被下线的次数
+                'idle_logouts': 0,
+                # 按接口统计的请求数
+                'endpoints': Counter(),
+            }
+
+    def touch(self, session):
+        """记录会话的一次请求，先把空闲超时的会话下线"""
+        now = time.monotonic()
+        with self.lock:
+            last = self.last_seen.get(session)
+            if (self.idle_timeout is not None and last is not None
+                    and now - last > self.idle_timeout and session in self.online_users):
+                del self.online_users[session]
+                self.stats['idle_logouts'] += 1
+            self.last_seen[session] = now
+
+    def client_key(self, session, query_string=None):
+        """在线状态的归属：按IP区分时为终端IP，否则为会话"""
+        if not self.track_by_ip:
+            return session
+        if query_string:
+            return parse_qs(query_string).get('wlanuserip', [self.host_ip])[0]
+        return self.host_ip
+
+    def online_user_info(self, session=None):
+        with self.lock:
+            username = self.online_users.get(session)
+        if username:
+            ball_info = [
+                {'displayName': '在线时长', 'type': 'time', 'value': '1小时5分'},
+                {'displayName': '已用流量', 'type': 'flow', 'value': '325.6MB'},
+            ]
+            return {'result': 'success', 'message': '', 'userIndex': 'mock-user-index',
+                    'userId': username, 'userName': '测试用户', 'userIp': '10.20.30.40',
+                    'userMac': '00e04c680001', 'service': '校园网',
+                    'keepaliveInterval': self.keepalive_interval,
+                    'ballInfo': json.dumps(ball_info, ensure_ascii=False)}
+        return {'result': 'fail', 'message': '用户未在线', 'userIndex': None}
+
+    def do_login(self, username, password, session=None):
+        if self.require_session and session not in self.visited_sessions:
+            return {'result': 'fail', 'message': '会话已失效，请重新打开认证页面'}
+        if username in self.accounts and self.accounts[username] == password:
+            with self.lock:
+                self.online_users[session] = username
+            return {'result': 'success', 'message': '', 'userIndex': 'mock-user-index'}
+        return {'result': 'fail', 'message': '用户名或密码错误'}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == '__main__':
+    # 单独进程运行模拟门户，启动后输出地址，便于测量客户端进程自身的资源占用
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本地模拟ePortal")
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0)
+    args = parser.parse_args()
+    portal = MockPortal(port=args.port, latency=args.latency).start()
+    print(portal.base_url, flush=True)
+    try:
+        portal._thread.join()
+    except KeyboardInterrupt:
+        portal.stop()
@@ -0,0 +1,197 @@
+import random
+import threading
+from logger import logger
+
+
+class NetworkWatchdog:
+    """后台监测认证状态，掉线后使用保存的凭据自动重新登录
+
+    config 提供 credentials_for_network(门户地址) -> (用户名, 密码)，
+    每次重新登录时按当前网络重新选择账号。
+
+    在线时按逐渐变长的间隔轮询，掉线后按带抖动的指数退避快速重试。
+    传入 heartbeat 时在线轮询间隔不超过学到的心跳间隔，赶在门户空闲下线前访问门户。
+    其他地方刚查询过状态时顺延本次检查，不重复请求。
+    状态变化通过监听回调通知，回调在监测线程中执行。
+    """
+
+    STATE_STOPPED = 'stopped'
+    STATE_ONLINE = 'online'
+    STATE_OFFLINE = 'offline'
+    STATE_RELOGIN = 'relogin'
+    STATE_UNREACHABLE = 'unreachable'
+
+    # 在线时状态查询连续失败(门户可达但超时或响应无效)这么多次以内只重试查询，不重新登录
+    STATUS_FAILURE_TOLERANCE = 2
+
+    def __init__(self, auth, config, healthy_interval=30, max_healthy_interval=300,
+                 retry_interval=2, max_retry_interval=60, heartbeat=None):
+        self.auth = auth
+        self.config = config
+        # 在线时的轮询间隔(秒)，持续在线时逐步放大到 max_healthy_interval
+        self.healthy_interval = healthy_interval
+        self.max_healthy_interval = max_healthy_interval
+        # 掉线后的重试间隔(秒)，每次失败翻倍直到 max_retry_interval
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.heartbeat = heartbeat
+
+        self.state = self.STATE_STOPPED
+        self.failures = 0
+        self._interval = healthy_interval
+        self._listeners = []
+        # 每次启动使用新的事件，停止时未能及时退出的旧线程不会被下一次启动唤醒
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        # 监测线程在此记录自己的停止事件
+        self._local = threading.local()
+        self._forced = False
+        self._running = False
+        self._thread = None
+
+    def add_listener(self, callback):
+        """添加状态变化回调 callback(state)"""
+        self._listeners.append(callback)
+
+    def _stopped(self):
+        """当前线程是否为已被停止的监测线程"""
+        stop = getattr(self._local, 'stop', None)
+        return stop is not None and stop.is_set()
+
+    def _set_state(self, state):
+        if state == self.state or self._stopped():
+            # 已停止的监测线程不再改变状态
+            return
+        logger.info(f"网络监测状态: {self.state} -> {state}")
+        self.state = state
+        for callback in self._listeners:
+            try:
+                callback(state)
+            except Exception as e:
+                logger.error(f"网络监测回调出错: {str(e)}")
+
+    def start(self, initial_delay=None):
+        """启动监测线程，首次检查在 initial_delay 秒后进行"""
+        if self._running:
+            return
+        self._running = True
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        delay = self.healthy_interval if initial_delay is None else initial_delay
+        self._thread = threading.Thread(target=self._run, args=(delay, self._wakeup, self._stop),
+                                        name='NetworkWatchdog', daemon=True)
+        self._thread.start()
+        logger.info("网络监测已启动")
+
+    def stop(self):
+        """停止监测线程"""
+        if not self._running:
+            return
+        self._running = False
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1)
+            if self._thread.is_alive():
+                # 正在查询或登录，完成后自行退出
+                logger.info("网络监测线程将在当前请求完成后退出")
+        self._thread = None
+        self._set_state(self.STATE_STOPPED)
+        logger.info("网络监测已停止")
+
+    def check_now(self):
+        """立即进行一次检查"""
+        self._forced = True
+        self._wakeup.set()
+
+    def is_running(self):
+        return self._running
+
+    def _run(self, delay, wakeup, stop):
+        self._local.stop = stop
+        while True:
+            # 两次检查之间线程阻塞在事件上，不占用CPU
+            wakeup.wait(delay)
+            wakeup.clear()
+            if stop.is_set():
+                break
+            try:
+                delay = self._poll()
+            except Exception as e:
+                logger.error(f"网络监测出错: {str(e)}")
+                delay = self._next_retry_delay()
+
+    def _poll(self):
+        """检查一次状态，返回到下一次检查的等待秒数"""
+        forced, self._forced = self._forced, False
+        if self.state == self.STATE_ONLINE and not forced:
+            online, age = self.auth.status_snapshot()
+            if online and age is not None and age < self._healthy_delay():
+                # 刚有其他查询确认在线，从那次查询起重新计时
+                self._observe_online(age)
+                return self._healthy_delay() - age
+
+        if self.auth.check_status():
+            self._observe_online()
+            if self.state == self.STATE_ONLINE:
+                self._interval = min(self._interval * 1.5, self.max_healthy_interval)
+            else:
+                self._mark_online()
+            return self._healthy_delay()
+
+        if not self.auth.is_reachable():
+            # 门户不可达时无法登录，等待网络恢复
+            self._set_state(self.STATE_UNREACHABLE)
+            return self._next_retry_delay()
+
+        # 查询失败时没有在线信息；门户明确回答未在线时为假值的 OnlineUserInfo
+        answered = self.auth.cached_online_info() is not None
+        if (not answered and self.state == self.STATE_ONLINE
+                and self.failures < self.STATUS_FAILURE_TOLERANCE):
+            # 一次查询失败不能说明已下线，稍后再查
+            logger.info("网络监测: 状态查询失败，稍后重试")
+            return min(self._next_retry_delay(), self._healthy_delay())
+
+        logger.info("网络监测: 检测到未认证")
+        if self.heartbeat and self.state == self.STATE_ONLINE and answered:
+            # 门户确认会话被下线，据此学习空闲超时
+            self.heartbeat.observe_logout()
+        self._set_state(self.STATE_OFFLINE)
+        username, password = self.config.credentials_for_network(self.auth.base_url)
+        if username and password and not self._stopped():
+            self._set_state(self.STATE_RELOGIN)
+            result = self.auth.login(username, password)
+            if result:
+                logger.info("网络监测: 自动重新登录成功")
+                self._observe_online()
+                self._mark_online()
+                return self._healthy_delay()
+            logger.error("网络监测: 自动重新登录失败")
+            self._set_state(self.STATE_OFFLINE)
+            # 门户熔断期间不必提前重试
+            breaker = getattr(self.auth, 'circuit_breaker', None)
+            if breaker is not None:
+                return max(self._next_retry_delay(), breaker.remaining())
+        return self._next_retry_delay()
+
+    def _observe_online(self, age=0):
+        if self.heartbeat:
+            info = self.auth.cached_online_info()
+            self.heartbeat.observe_online(age, info.keepalive_interval if info else None)
+
+    def _healthy_delay(self):
+        """在线时到下一次检查的秒数"""
+        if self.heartbeat:
+            return min(self._interval, self.heartbeat.interval)
+        return self._interval
+
+    def _mark_online(self):
+        self.failures = 0
+        self._interval = self.healthy_interval
+        self._set_state(self.STATE_ONLINE)
+
+    def _next_retry_delay(self):
+        self.failures += 1
+        delay = min(self.retry_interval * 2 ** (self.failures - 1), self.max_retry_interval)
+        # 随机抖动，避免多台机器同时重试
+        return random.uniform(delay / 2, delay)
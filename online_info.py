@@ -0,0 +1,74 @@
+import json
+
+
+class OnlineUserInfo:
+    """getOnlineUserInfo 返回的在线信息，只解析一次并随认证状态一起缓存
+
+    可以直接当作布尔值使用，表示是否在线。门户没有返回的字段为 None。
+    """
+
+    __slots__ = ('online', 'user_index', 'user_id', 'user_name', 'user_ip', 'user_mac',
+                 'service', 'online_time', 'flow', 'keepalive_interval', 'message')
+
+    # 门户字段名 -> 属性名
+    FIELDS = {
+        'userIndex': 'user_index',
+        'userId': 'user_id',
+        'userName': 'user_name',
+        'userIp': 'user_ip',
+        'userMac': 'user_mac',
+        'service': 'service',
+        'keepaliveInterval': 'keepalive_interval',
+        'message': 'message',
+    }
+
+    def __init__(self, online=False, **fields):
+        self.online = online
+        for name in self.__slots__[1:]:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_json(cls, data):
+        """由响应JSON创建，非在线结果也保留门户返回的提示信息"""
+        fields = {attr: data.get(key) or None for key, attr in cls.FIELDS.items()}
+        fields.update(cls._parse_ball_info(data.get('ballInfo')))
+        online = bool(data.get('result') == 'success' and data.get('userIndex'))
+        return cls(online, **fields)
+
+    @staticmethod
+    def _parse_ball_info(ball_info):
+        """ballInfo 是门户页面悬浮框显示的信息(JSON字符串)，从中取在线时长和流量"""
+        if not ball_info:
+            return {}
+        try:
+            items = json.loads(ball_info) if isinstance(ball_info, str) else ball_info
+        except ValueError:
+            return {}
+        fields = {}
+        for item in items if isinstance(items, list) else ():
+            if not isinstance(item, dict):
+                continue
+            if item.get('type') == 'time':
+                fields['online_time'] = item.get('value')
+            elif item.get('type') == 'flow':
+                fields['flow'] = item.get('value')
+        return fields
+
+    def __bool__(self):
+        return self.online
+
+    def __repr__(self):
+        return f"OnlineUserInfo({self.online}, user_id={self.user_id!r}, user_ip={self.user_ip!r})"
+
+    def details(self):
+        """用于显示的 [(名称, 值)]，省略门户没有返回的字段"""
+        labels = (
+            ('账号', self.user_id),
+            ('姓名', self.user_name),
+            ('IP', self.user_ip),
+            ('MAC', self.user_mac),
+            ('服务', self.service),
+            ('在线时长', self.online_time),
+            ('已用流量', self.flow),
+        )
+        return [(label, value) for label, value in labels if value]
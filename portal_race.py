@@ -0,0 +1,123 @@
+import json
+import queue
+import threading
+import time
+from pathlib import Path
+from logger import logger
+from atomic_file import write_atomic
+
+
+def race(candidates, attempt, stagger=0.05, timeout=3):
+    """按顺序错开 stagger 秒依次启动 attempt(candidate)，返回最先成功的结果
+
+    前一个候选失败时立即启动下一个，不必等满 stagger。
+    返回 (candidate, 结果, 耗时秒数)；timeout 秒内全部失败或无响应时返回 None。
+    未完成的尝试在后台线程中继续运行直到自身超时，结果被丢弃。
+    """
+    results = queue.Queue()
+
+    def run(candidate):
+        start = time.perf_counter()
+        try:
+            result = attempt(candidate)
+        except Exception as e:
+            results.put((candidate, None, e, time.perf_counter() - start))
+        else:
+            results.put((candidate, result, None, time.perf_counter() - start))
+
+    remaining = list(candidates)
+    deadline = time.perf_counter() + timeout
+    pending = 0
+    while remaining or pending:
+        if remaining:
+            threading.Thread(target=run, args=(remaining.pop(0),), daemon=True).start()
+            pending += 1
+        now = time.perf_counter()
+        if now >= deadline:
+            break
+        # 还有候选未启动时最多等 stagger 秒，否则等到超时
+        wait = deadline - now if not remaining else min(stagger, deadline - now)
+        try:
+            candidate, result, error, elapsed = results.get(timeout=wait)
+        except queue.Empty:
+            continue
+        pending -= 1
+        if error is None:
+            return candidate, result, elapsed
+        logger.info(f"门户 {candidate} 无响应: {str(error)}")
+    return None
+
+
+class PortalSelector:
+    """多个门户地址的选择：记住上次最快响应的门户和各门户的响应耗时
+
+    竞速时上次的胜出者最先启动，其余按记录的耗时排序。
+    """
+
+    def __init__(self, portals, stagger=0.05, state_file=None):
+        if not portals:
+            raise ValueError("至少需要一个门户地址")
+        self.portals = [url.rstrip('/') for url in portals]
+        # 依次启动下一个门户的间隔(秒)
+        self.stagger = stagger
+        self.state_file = state_file or Path.home() / '.campus_network' / 'portal_state.json'
+        self.winner = None
+        # {门户地址: 最近一次响应耗时(ms)}
+        self.latency = {}
+        self._lock = threading.Lock()
+        if self.multiple:
+            self._load()
+
+    @property
+    def multiple(self):
+        return len(self.portals) > 1
+
+    def _load(self):
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except:
+            return
+        if state.get('portals') != self.portals:
+            # 门户列表已修改，之前的记录作废
+            return
+        self.winner = state.get('winner')
+        self.latency = state.get('latency', {})
+
+    def _save(self):
+        try:
+            state = {'portals': self.portals, 'winner': self.winner, 'latency': self.latency}
+            write_atomic(self.state_file, json.dumps(state, separators=(',', ':')).encode('utf-8'))
+        except Exception as e:
+            logger.error(f"保存门户选择记录失败: {str(e)}")
+
+    def preferred(self):
+        """当前首选的门户"""
+        return self.winner if self.winner in self.portals else self.portals[0]
+
+    def order(self):
+        """竞速顺序：上次胜出者，其余按记录的耗时从小到大(没有记录的保持配置顺序)"""
+        first = self.preferred()
+        rest = [url for url in self.portals if url != first]
+        rest.sort(key=lambda url: self.latency.get(url, float('inf')))
+        return [first] + rest
+
+    def race(self, attempt, timeout=3):
+        """对所有门户竞速执行 attempt(门户地址)，返回 (门户地址, 结果) 或 None"""
+        outcome = race(self.order(), attempt, self.stagger, timeout)
+        if outcome is None:
+            return None
+        url, result, elapsed = outcome
+        self.record(url, elapsed)
+        return url, result
+
+    def record(self, url, elapsed):
+        """记录胜出的门户及其响应耗时(秒)，胜出者变化时写入文件"""
+        with self._lock:
+            self.latency[url] = round(elapsed * 1000, 1)
+            if url == self.winner:
+                return
+            if self.winner is not None:
+                logger.info(f"切换认证门户: {self.winner} -> {url}")
+            self.winner = url
+            self._save()
@@ -0,0 +1,216 @@
+import re
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from logger import logger
+
+MAC_PATTERN = re.compile(r'([0-9a-fA-F]{2}(?:[:-][0-9a-fA-F]{2}){5})')
+
+
+def _normalize_mac(mac):
+    return mac.lower().replace('-', ':') if mac else None
+
+
+def _run(args):
+    kwargs = {}
+    if sys.platform == 'win32':
+        # 不弹出控制台窗口
+        kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW
+    result = subprocess.run(args, capture_output=True, text=True, timeout=3, **kwargs)
+    return result.stdout
+
+
+def detect_gateway():
+    """返回默认网关的 (IP, MAC)，无法获取的项为 None"""
+    try:
+        if sys.platform == 'win32':
+            return _detect_gateway_windows()
+        return _detect_gateway_linux()
+    except Exception as e:
+        logger.error(f"获取默认网关失败: {str(e)}")
+        return None, None
+
+
+def _detect_gateway_windows():
+    ip = None
+    for line in _run(['route', 'print', '-4', '0.0.0.0']).splitlines():
+        fields = line.split()
+        if len(fields) >= 3 and fields[0] == '0.0.0.0' and fields[1] == '0.0.0.0':
+            ip = fields[2]
+            break
+    if not ip or ip.lower() == 'on-link':
+        return None, None
+    match = MAC_PATTERN.search(_run(['arp', '-a', ip]))
+    return ip, _normalize_mac(match.group(1)) if match else None
+
+
+def _detect_gateway_linux():
+    ip = None
+    with open('/proc/net/route') as f:
+        for line in f.readlines()[1:]:
+            fields = line.split()
+            # 目标为 0 且带 RTF_GATEWAY 标志的是默认路由，网关为小端十六进制
+            if fields[1] == '00000000' and int(fields[3], 16) & 2:
+                ip = '.'.join(str(b) for b in bytes.fromhex(fields[2])[::-1])
+                break
+    if not ip:
+        return None, None
+    with open('/proc/net/arp') as f:
+        for line in f.readlines()[1:]:
+            fields = line.split()
+            if fields[0] == ip and fields[3] != '00:00:00:00:00:00':
+                return ip, _normalize_mac(fields[3])
+    return ip, None
+
+
+class Profile:
+    """一个认证账号及其适用的网络"""
+
+    __slots__ = ('name', 'username', 'password', 'portal', 'gateway_ip', 'gateway_mac')
+
+    def __init__(self, name, username, password, portal=None, gateway_ip=None, gateway_mac=None):
+        self.name = name
+        self.username = username
+        self.password = password
+        self.portal = portal
+        self.gateway_ip = gateway_ip
+        self.gateway_mac = gateway_mac
+
+    def __repr__(self):
+        return f"Profile({self.name!r}, username={self.username!r}, portal={self.portal!r})"
+
+
+class ProfileStore:
+    """多账号存储：SQLite数据库，每行的密码单独用 Fernet 加密
+
+    账号按名称或网络标识(默认网关IP/MAC、门户地址)查找，均有索引。
+    cipher 可以是尚未完成的 Future(如 Config.cipher_future)，只在读写密码时等待。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS profiles (
+            name TEXT PRIMARY KEY,
+            username TEXT NOT NULL,
+            password BLOB NOT NULL,
+            portal TEXT,
+            gateway_ip TEXT,
+            gateway_mac TEXT,
+            last_used REAL NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS profiles_gateway_mac ON profiles (gateway_mac);
+        CREATE INDEX IF NOT EXISTS profiles_gateway_ip ON profiles (gateway_ip);
+        CREATE INDEX IF NOT EXISTS profiles_portal ON profiles (portal);
+    """
+
+    COLUMNS = 'name, username, password, portal, gateway_ip, gateway_mac'
+
+    def __init__(self, cipher, db_file=None):
+        self._cipher = cipher
+        self.db_file = db_file or Path.home() / '.campus_network' / 'profiles.db'
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.db_file), check_same_thread=False)
+        with self._db:
+            self._db.executescript(self.SCHEMA)
+
+    @property
+    def cipher(self):
+        return self._cipher.result() if isinstance(self._cipher, Future) else self._cipher
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _profile(self, row, cipher):
+        if row is None:
+            return None
+        name, username, token, portal, gateway_ip, gateway_mac = row
+        try:
+            password = cipher.decrypt(bytes(token)).decode()
+        except Exception as e:
+            logger.error(f"账号 {name} 的密码解密失败: {str(e)}")
+            password = ''
+        return Profile(name, username, password, portal, gateway_ip, gateway_mac)
+
+    def save(self, name, username, password, portal=None, gateway_ip=None, gateway_mac=None):
+        """添加或更新账号"""
+        token = self.cipher.encrypt(password.encode())
+        self._save_token(name, username, token, portal, gateway_ip, gateway_mac)
+
+    def import_token(self, name, username, token, portal=None):
+        """导入已用同一密钥加密的密码(如 config.json 中保存的密码)"""
+        self._save_token(name, username, token.encode(), portal, None, None)
+
+    def _save_token(self, name, username, token, portal, gateway_ip, gateway_mac):
+        with self._lock, self._db:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO profiles ({self.COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)",
+                (name, username, token, portal.rstrip('/') if portal else None,
+                 gateway_ip or None, _normalize_mac(gateway_mac)))
+
+    def remove(self, name):
+        """删除账号，返回是否存在"""
+        with self._lock, self._db:
+            return self._db.execute("DELETE FROM profiles WHERE name = ?", (name,)).rowcount > 0
+
+    def get(self, name):
+        """按名称查找账号"""
+        # 先等待密钥就绪，密钥迁移期间不会读到旧密钥加密的密码
+        cipher = self.cipher
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {self.COLUMNS} FROM profiles WHERE name = ?", (name,)).fetchone()
+        return self._profile(row, cipher)
+
+    def profiles(self):
+        """所有账号(不解密密码)，按名称排序"""
+        with self._lock:
+            rows = self._db.execute(f"SELECT {self.COLUMNS} FROM profiles ORDER BY name").fetchall()
+        return [Profile(name, username, None, portal, gateway_ip, gateway_mac)
+                for name, username, _, portal, gateway_ip, gateway_mac in rows]
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM profiles").fetchone()[0]
+
+    def match(self, portal=None, gateway_ip=None, gateway_mac=None):
+        """查找适用于当前网络的账号
+
+        网关MAC匹配优先于网关IP，其次是门户地址；同等条件下取最近使用的。没有匹配时返回 None。
+        """
+        gateway_mac = _normalize_mac(gateway_mac)
+        portal = portal.rstrip('/') if portal else None
+        cipher = self.cipher
+        # 三个条件各自走索引(OR 优化)，一次查询完成
+        with self._lock:
+            row = self._db.execute(
+                f"""SELECT {self.COLUMNS} FROM profiles
+                    WHERE gateway_mac = ? OR gateway_ip = ? OR portal = ?
+                    ORDER BY (gateway_mac = ?) DESC, (gateway_ip = ?) DESC, last_used DESC
+                    LIMIT 1""",
+                (gateway_mac, gateway_ip, portal, gateway_mac, gateway_ip)).fetchone()
+        return self._profile(row, cipher)
+
+    def reencrypt(self, old_cipher, new_cipher):
+        """密钥迁移时用新密钥重新加密所有账号的密码，返回重新加密的账号数"""
+        with self._lock, self._db:
+            rows = self._db.execute("SELECT name, password FROM profiles").fetchall()
+            count = 0
+            for name, token in rows:
+                try:
+                    password = old_cipher.decrypt(bytes(token))
+                except Exception as e:
+                    logger.error(f"迁移密钥时账号 {name} 的密码解密失败: {str(e)}")
+                    continue
+                self._db.execute("UPDATE profiles SET password = ? WHERE name = ?",
+                                 (new_cipher.encrypt(password), name))
+                count += 1
+        return count
+
+    def touch(self, name):
+        """记录账号的使用时间"""
+        with self._lock, self._db:
+            self._db.execute("UPDATE profiles SET last_used = ? WHERE name = ?", (time.time(), name))
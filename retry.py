@@ -0,0 +1,155 @@
+import random
+import threading
+import time
+from logger import logger
+
+# 失败类型
+ERROR_TIMEOUT = 'timeout'
+ERROR_CONNECTION = 'connection'
+ERROR_SERVER = 'server_error'
+ERROR_BAD_CREDENTIALS = 'bad_credentials'
+ERROR_PROTOCOL = 'protocol'
+
+
+class ServerError(Exception):
+    """门户返回5xx错误"""
+
+
+def classify_exception(exc):
+    """把请求异常归类为 ERROR_SERVER / ERROR_TIMEOUT / ERROR_CONNECTION / ERROR_PROTOCOL
+
+    不直接依赖 requests 的异常类型，按类名识别超时。
+    """
+    if isinstance(exc, ServerError):
+        return ERROR_SERVER
+    for cls in type(exc).__mro__:
+        if 'Timeout' in cls.__name__ or cls is TimeoutError:
+            return ERROR_TIMEOUT
+    if isinstance(exc, OSError):
+        return ERROR_CONNECTION
+    return ERROR_PROTOCOL
+
+
+def interruptible_sleep(delay, cancel_event=None):
+    """等待 delay 秒；cancel_event 被设置时提前结束并返回 False"""
+    if cancel_event is not None:
+        return not cancel_event.wait(delay)
+    time.sleep(delay)
+    return True
+
+
+class RetryPolicy:
+    """重试策略：最大次数、指数退避、随机抖动、按失败类型决定是否重试
+
+    账号密码错误永远不重试。退避等待通过 sleep(秒数, cancel_event) 进行，
+    签名与 interruptible_sleep 相同，可替换为假时钟的实现用于测试；
+    异步版本通过 async_sleep(秒数) 协程函数等待，默认为 asyncio.sleep。
+    """
+
+    DEFAULT_RETRY_ON = frozenset((ERROR_TIMEOUT, ERROR_CONNECTION, ERROR_SERVER))
+
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=8, jitter=0.5,
+                 retry_on=DEFAULT_RETRY_ON, sleep=interruptible_sleep, rng=None, async_sleep=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # 抖动比例：实际等待时间在 [delay*(1-jitter), delay] 之间
+        self.jitter = jitter
+        self.retry_on = frozenset(retry_on) - {ERROR_BAD_CREDENTIALS}
+        self.sleep = sleep
+        self.async_sleep = async_sleep
+        self.rng = rng or random.Random()
+
+    def should_retry(self, error, attempt):
+        """第 attempt 次(从1开始)因 error 失败后是否继续重试"""
+        return attempt < self.max_attempts and error in self.retry_on
+
+    def delay(self, attempt):
+        """第 attempt 次失败后的等待秒数"""
+        delay = min(self.base_delay * 2 ** (attempt - 1), self.max_delay)
+        return delay * (1 - self.jitter * self.rng.random())
+
+    def wait(self, attempt, cancel_event=None):
+        """等待退避时间；cancel_event 被设置时提前返回 False"""
+        return self.sleep(self.delay(attempt), cancel_event)
+
+    async def wait_async(self, attempt):
+        """在事件循环中等待退避时间"""
+        sleep = self.async_sleep
+        if sleep is None:
+            # 只有异步版本需要，不在导入时加载 asyncio
+            import asyncio
+            sleep = asyncio.sleep
+        await sleep(self.delay(attempt))
+
+
+class CircuitBreaker:
+    """熔断器：连续失败达到阈值后在冷却期内拒绝请求，冷却结束后放行一次试探
+
+    试探请求记录成功或失败之前，其他请求继续被拒绝；试探请求超过 cooldown 秒
+    仍未记录结果(如被取消)时再放行一次。clock 可替换为假时钟用于测试。
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, cooldown=60, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        # 熔断后的冷却时间(秒)
+        self.cooldown = cooldown
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0
+        # 放行试探请求的时间
+        self._trial_at = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """是否允许向门户发送请求"""
+        with self._lock:
+            now = self.clock()
+            if self.state == self.OPEN:
+                if now - self._opened_at < self.cooldown:
+                    return False
+                # 冷却结束，放行一次试探请求
+                self.state = self.HALF_OPEN
+                self._trial_at = now
+                logger.info("熔断冷却结束，尝试恢复请求")
+                return True
+            if self.state == self.HALF_OPEN:
+                if now - self._trial_at < self.cooldown:
+                    # 等待试探请求的结果
+                    return False
+                logger.info("试探请求没有结果，再次尝试")
+                self._trial_at = now
+            return True
+
+    def remaining(self):
+        """熔断剩余秒数"""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0
+            return max(0, self.cooldown - (self.clock() - self._opened_at))
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("门户恢复正常，关闭熔断")
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.error(f"门户连续失败 {self.failures} 次，暂停请求 {self.cooldown} 秒")
+                self.state = self.OPEN
+                self._opened_at = self.clock()
+
+    def reset(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
@@ -0,0 +1,46 @@
+import hashlib
+import random
+import time
+from auth import AuthResult, AuthCancelled
+from logger import logger
+
+
+def machine_offset(device_id, window):
+    """由设备标识(如MAC地址)得到 [0, window) 内固定的偏移秒数
+
+    同一台机器每次开机的偏移相同，不同机器均匀分散在窗口内。
+    """
+    if window <= 0:
+        return 0.0
+    digest = hashlib.sha256(str(device_id).encode()).digest()
+    return int.from_bytes(digest[:8], 'big') / 2 ** 64 * window
+
+
+def startup_delay(device_id, window, jitter=0.0, rng=random):
+    """开机登录前的等待秒数：本机固定偏移加上 [0, jitter) 的随机抖动"""
+    delay = machine_offset(device_id, window)
+    if jitter > 0:
+        delay += rng.uniform(0, jitter)
+    return delay
+
+
+def staggered_login(auth, username, password, device_id, window, jitter=0.0,
+                    cancel_event=None, sleep=time.sleep):
+    """错峰的开机登录
+
+    机房大量机器同时开机时，先查询状态，已在线则直接返回；
+    否则等待本机的错峰时间再登录，避免同一时刻压垮门户。
+    """
+    if auth.check_status():
+        logger.info("开机检查: 已经认证，跳过登录")
+        return AuthResult(True, AuthResult.ALREADY_ONLINE)
+
+    delay = startup_delay(device_id, window, jitter)
+    if delay > 0:
+        logger.info(f"错峰登录: 等待 {delay:.1f} 秒")
+        if cancel_event is not None:
+            if cancel_event.wait(delay):
+                raise AuthCancelled()
+        else:
+            sleep(delay)
+    return auth.login(username, password, cancel_event=cancel_event)
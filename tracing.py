@@ -0,0 +1,173 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from logger import logger
+
+
+class Span:
+    """一次计时记录，在 with 块结束时写入追踪器"""
+
+    __slots__ = ('name', 'attrs', 'parent', 'start_time', '_start', 'duration', '_tracer')
+
+    def __init__(self, tracer, name, parent, attrs):
+        self._tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.attrs = attrs
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attrs):
+        """附加属性，如响应大小、重试次数"""
+        self.attrs.update(attrs)
+
+    def incr(self, key, amount=1):
+        self.attrs[key] = self.attrs.get(key, 0) + amount
+
+    def __enter__(self):
+        self._tracer._push(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._start
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self._tracer._pop(self)
+        return False
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'parent': self.parent,
+            'start': self.start_time,
+            'duration_ms': round(self.duration * 1000, 3),
+            **self.attrs,
+        }
+
+
+class _NullSpan:
+    """追踪关闭时使用的空记录，不做任何事"""
+
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def incr(self, key, amount=1):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """记录认证各阶段的耗时
+
+    关闭时 span() 直接返回共享的空记录，几乎没有开销。
+    开启后每条记录保存在内存中(最多 max_records 条)，可通过 records()/summary() 查询，
+    同时以 JSON 写入日志，并通知监听回调。
+    """
+
+    def __init__(self, enabled=False, max_records=1000, log_records=True):
+        self.enabled = enabled
+        self.log_records = log_records
+        self._records = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._listeners = []
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def add_listener(self, callback):
+        """添加记录回调 callback(record)"""
+        self._listeners.append(callback)
+
+    def span(self, name, **attrs):
+        """创建计时记录，嵌套使用时自动关联上一级"""
+        if not self.enabled:
+            return _NULL_SPAN
+        stack = getattr(self._local, 'stack', None)
+        parent = stack[-1].name if stack else None
+        return Span(self, name, parent, attrs)
+
+    def current(self):
+        """当前线程中最内层的记录"""
+        if not self.enabled:
+            return _NULL_SPAN
+        stack = getattr(self._local, 'stack', None)
+        return stack[-1] if stack else _NULL_SPAN
+
+    def _push(self, span):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(span)
+
+    def _pop(self, span):
+        stack = self._local.stack
+        if stack and stack[-1] is span:
+            stack.pop()
+        record = span.to_dict()
+        with self._lock:
+            self._records.append(record)
+        if self.log_records:
+            logger.info(f"trace {json.dumps(record, ensure_ascii=False)}")
+        for callback in self._listeners:
+            try:
+                callback(record)
+            except Exception as e:
+                logger.error(f"追踪回调出错: {str(e)}")
+
+    def records(self, name=None, since=None):
+        """查询记录，可按名称和起始时间(time.time())过滤"""
+        with self._lock:
+            records = list(self._records)
+        return [r for r in records
+                if (name is None or r['name'] == name)
+                and (since is None or r['start'] >= since)]
+
+    def summary(self):
+        """按名称汇总：次数、平均/最大耗时(ms)"""
+        result = {}
+        for record in self.records():
+            item = result.setdefault(record['name'], {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            item['count'] += 1
+            item['total_ms'] += record['duration_ms']
+            item['max_ms'] = max(item['max_ms'], record['duration_ms'])
+        for item in result.values():
+            item['avg_ms'] = item['total_ms'] / item['count']
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+
+# 创建全局追踪实例，设置环境变量 CCIT_TRACE=1 时开启
+tracer = Tracer(enabled=os.environ.get('CCIT_TRACE') == '1')
+
+
+def traced(name):
+    """装饰器：在追踪开启时为函数调用创建计时记录，并记录返回值是否为真(ok)"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.span(name) as span:
+                result = func(*args, **kwargs)
+                span.set(ok=bool(result))
+                return result
+        return wrapper
+    return decorator
@@ -0,0 +1,290 @@
+import http.client
+import json
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlencode, urljoin, urlsplit
+
+# 门户只用到这几个跳转状态码
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+# 流式读取响应体时每次读取的字节数
+CHUNK_SIZE = 1024
+
+
+class TransportError(Exception):
+    """传输层错误"""
+
+
+class Response:
+    """http.client 后端的响应，提供认证器用到的 requests.Response 子集"""
+
+    def __init__(self, status_code, url, headers, content):
+        self.status_code = status_code
+        self.url = url
+        self.headers = headers
+        self.content = content
+        self.encoding = None
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.text)
+
+    def close(self):
+        pass
+
+
+class RequestsTransport:
+    """基于 requests 的传输后端"""
+
+    name = 'requests'
+
+    def __init__(self, headers=None, keep_alive=True, pool_size=4, idle_timeout=30):
+        # 延迟导入，使用 http.client 后端时不加载 requests
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.keep_alive = keep_alive
+        self.idle_timeout = idle_timeout
+        self._last_request_time = 0
+        self.session = requests.session()
+        self.session.headers.update(headers or {})
+        self.session.headers['Connection'] = 'keep-alive' if keep_alive else 'close'
+        if keep_alive:
+            # 只访问一个门户，一个连接池即可
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            self.session.mount('http://', adapter)
+
+    def request(self, method, url, params=None, data=None, timeout=None, allow_redirects=True,
+                stream=False):
+        now = time.monotonic()
+        if (self.keep_alive and self._last_request_time
+                and now - self._last_request_time > self.idle_timeout):
+            # 清空连接池，下次请求重新建立连接
+            self.session.close()
+        try:
+            return self.session.request(method, url, params=params, data=data,
+                                        timeout=timeout, allow_redirects=allow_redirects,
+                                        stream=stream)
+        finally:
+            self._last_request_time = time.monotonic()
+
+    def fetch_prefix(self, url, timeout=None, max_bytes=4096, until=None):
+        """GET 请求但不跟随跳转，只读取响应体开头
+
+        每读到一块调用 until(已读内容)，返回真时停止读取；最多读取 max_bytes。
+        未读完的响应会关闭连接，不放回连接池。
+        """
+        r = self.request('GET', url, timeout=timeout, allow_redirects=False, stream=True)
+        content = b''
+        try:
+            for chunk in r.iter_content(CHUNK_SIZE):
+                content += chunk
+                if len(content) >= max_bytes or (until and until(content)):
+                    # 提前结束，丢弃连接
+                    r.close()
+                    break
+            # 读完的响应由 requests 自动放回连接池
+        except Exception:
+            r.close()
+            raise
+        return Response(r.status_code, url, r.headers, content[:max_bytes])
+
+    def export_cookies(self):
+        """导出Cookie列表 [{name, value, expires, domain, path}]，expires 为空表示会话Cookie"""
+        return [{'name': c.name, 'value': c.value, 'expires': c.expires,
+                 'domain': c.domain, 'path': c.path} for c in self.session.cookies]
+
+    def import_cookies(self, cookies):
+        for c in cookies:
+            self.session.cookies.set(c['name'], c['value'], expires=c.get('expires'),
+                                     domain=c.get('domain') or '', path=c.get('path') or '/')
+
+    def clear_cookies(self):
+        self.session.cookies.clear()
+
+    def close(self):
+        self.session.close()
+        self._last_request_time = 0
+
+
+class HttpClientTransport:
+    """基于标准库 http.client 的轻量传输后端
+
+    只支持认证器用到的功能：明文HTTP、GET/表单POST、跳转、简单Cookie。
+    """
+
+    name = 'http.client'
+
+    def __init__(self, headers=None, keep_alive=True, idle_timeout=30, **_):
+        self.headers = dict(headers or {})
+        self.headers['Connection'] = 'keep-alive' if keep_alive else 'close'
+        self.keep_alive = keep_alive
+        self.idle_timeout = idle_timeout
+        self.cookies = {}
+        # Cookie名 -> 过期时间(time.time())，会话Cookie不在其中
+        self.cookie_expires = {}
+        # (主机, 端口) -> (连接, 上次使用时间)
+        self._connections = {}
+
+    def request(self, method, url, params=None, data=None, timeout=None, allow_redirects=True):
+        if params:
+            url += ('&' if '?' in url else '?') + urlencode(params)
+        body = urlencode(data) if data is not None else None
+
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self._send(method, url, body, timeout)
+            location = response.headers.get('Location')
+            if not (allow_redirects and response.status_code in REDIRECT_CODES and location):
+                return response
+            url = urljoin(url, location)
+            if response.status_code in (301, 302, 303) and method == 'POST':
+                method, body = 'GET', None
+        raise TransportError("重定向次数过多")
+
+    def _get_connection(self, key, timeout):
+        entry = self._connections.pop(key, None)
+        if entry:
+            conn, last_used = entry
+            if time.monotonic() - last_used <= self.idle_timeout:
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+            conn.close()
+        return http.client.HTTPConnection(key[0], key[1], timeout=timeout), False
+
+    def fetch_prefix(self, url, timeout=None, max_bytes=4096, until=None):
+        """GET 请求但不跟随跳转，只读取响应体开头
+
+        每读到一块调用 until(已读内容)，返回真时停止读取；最多读取 max_bytes。
+        未读完的响应会关闭连接。
+        """
+        return self._send('GET', url, None, timeout, max_bytes=max_bytes, until=until)
+
+    def _read_prefix(self, resp, max_bytes, until):
+        content = b''
+        while len(content) < max_bytes:
+            chunk = resp.read(min(CHUNK_SIZE, max_bytes - len(content)))
+            if not chunk:
+                break
+            content += chunk
+            if until and until(content):
+                break
+        return content
+
+    def _send(self, method, url, body, timeout, max_bytes=None, until=None):
+        parts = urlsplit(url)
+        if parts.scheme != 'http':
+            raise TransportError(f"不支持的协议: {parts.scheme}")
+        key = (parts.hostname, parts.port or 80)
+        path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+
+        headers = dict(self.headers)
+        cookies = self._live_cookies()
+        if cookies:
+            headers['Cookie'] = '; '.join(f"{k}={v}" for k, v in cookies.items())
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        conn, reused = self._get_connection(key, timeout)
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            resp = conn.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            conn.close()
+            if not reused:
+                raise
+            # 复用的连接已被对端关闭，新建连接重试一次
+            conn = http.client.HTTPConnection(key[0], key[1], timeout=timeout)
+            conn.request(method, path, body=body, headers=headers)
+            resp = conn.getresponse()
+
+        try:
+            if max_bytes is None:
+                content = resp.read()
+            else:
+                content = self._read_prefix(resp, max_bytes, until)
+        except Exception:
+            conn.close()
+            raise
+        self._store_cookies(resp)
+        if self.keep_alive and not resp.will_close and resp.isclosed():
+            self._connections[key] = (conn, time.monotonic())
+        else:
+            conn.close()
+        return Response(resp.status, url, resp.headers, content)
+
+    def _store_cookies(self, resp):
+        for header in resp.headers.get_all('Set-Cookie') or ():
+            pair, *attrs = header.split(';')
+            name, _, value = pair.partition('=')
+            name = name.strip()
+            if not name:
+                continue
+            self.cookies[name] = value.strip()
+            expires = self._cookie_expiry(attrs)
+            if expires is None:
+                self.cookie_expires.pop(name, None)
+            else:
+                self.cookie_expires[name] = expires
+
+    @staticmethod
+    def _cookie_expiry(attrs):
+        """从 Max-Age/Expires 属性得到过期时间，都没有时返回 None"""
+        expires = None
+        for attr in attrs:
+            key, _, value = attr.strip().partition('=')
+            try:
+                if key.lower() == 'max-age':
+                    # Max-Age 优先于 Expires
+                    return time.time() + int(value)
+                if key.lower() == 'expires':
+                    expires = parsedate_to_datetime(value.strip()).timestamp()
+            except (TypeError, ValueError):
+                continue
+        return expires
+
+    def _live_cookies(self):
+        """去掉已过期的Cookie后返回"""
+        now = time.time()
+        for name, expires in list(self.cookie_expires.items()):
+            if expires <= now:
+                self.cookies.pop(name, None)
+                del self.cookie_expires[name]
+        return self.cookies
+
+    def export_cookies(self):
+        """导出Cookie列表 [{name, value, expires}]，expires 为空表示会话Cookie"""
+        return [{'name': name, 'value': value, 'expires': self.cookie_expires.get(name)}
+                for name, value in self._live_cookies().items()]
+
+    def import_cookies(self, cookies):
+        for c in cookies:
+            self.cookies[c['name']] = c['value']
+            if c.get('expires') is not None:
+                self.cookie_expires[c['name']] = c['expires']
+
+    def clear_cookies(self):
+        self.cookies.clear()
+        self.cookie_expires.clear()
+
+    def close(self):
+        for conn, _ in self._connections.values():
+            conn.close()
+        self._connections.clear()
+
+
+TRANSPORTS = {
+    RequestsTransport.name: RequestsTransport,
+    HttpClientTransport.name: HttpClientTransport,
+}
+
+
+def create_transport(name, **options):
+    """按名称创建传输后端"""
+    try:
+        return TRANSPORTS[name](**options)
+    except KeyError:
+        raise ValueError(f"未知的传输后端: {name}") from None